@@ -0,0 +1,247 @@
+# bench/webhook_load.py
+# Нагрузочный тест webhook: запускает замену Bot API (fake_telegram.py) и бота (main.py) локально,
+# прогоняет синтетические обновления полного сценария регистрации и оплаты
+# и печатает p50/p95/p99 задержки и число обновлений в секунду.
+#
+# Нужна отдельная (одноразовая) база PostgreSQL — бот создаёт в ней пользователей:
+#   DATABASE_URL=postgresql://localhost/wordzen_bench python -m bench.webhook_load --users 200 --concurrency 20
+# Результат можно сохранить в JSON (--json result.json) и сравнивать между версиями.
+# --latency, --rate-limit и --blocked добавляют задержку Bot API и ошибки 429/403.
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import statistics
+import sys
+import time
+from collections import defaultdict
+
+import aiohttp
+
+from callbacks import PAY, PAYMENT_APPROVE, SOURCE, START_REGISTRATION
+from fake_telegram import FakeTelegram
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_TOKEN = "100000001:BENCHbenchBENCHbenchBENCHbench12345"
+ADMIN_ID = 100000002
+# Промокод из migrations/0004_seed_promo_codes.sql
+BENCH_PROMO = "Teacher01"
+
+
+class UpdateFactory:
+    def __init__(self):
+        # update_id в наносекундах: у последовательных прогонов они не пересекаются,
+        # иначе при UPDATE_DEDUP повторы молча пропускаются и завышают обн./сек.
+        self._update_ids = itertools.count(time.time_ns())
+        self._message_ids = itertools.count(1)
+
+    def _user(self, user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"Bench{user_id}", "username": f"bench{user_id}"}
+
+    def _message(self, user_id, text):
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+            "text": text,
+        }
+        if text.startswith("/"):
+            command = text.split()[0]
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        return message
+
+    def message(self, user_id, text):
+        return {"update_id": next(self._update_ids), "message": self._message(user_id, text)}
+
+    def callback(self, user_id, data, message_text="bench"):
+        return {
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": str(next(self._message_ids)),
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "message": self._message(user_id, message_text),
+                "data": data,
+            },
+        }
+
+
+# Сценарий одного пользователя: (шаг, обновление). Шаги выполняются строго по порядку,
+# потому что каждый следующий зависит от состояния FSM после предыдущего.
+def user_scenario(factory, user_id, with_promo):
+    steps = [
+        ("start", factory.message(user_id, "/start")),
+        ("start_registration", factory.callback(user_id, START_REGISTRATION.new())),
+    ]
+    if with_promo:
+        steps += [
+            ("source", factory.callback(user_id, SOURCE.new(source="teacher"))),
+            ("promo", factory.message(user_id, BENCH_PROMO)),
+        ]
+    else:
+        steps.append(("source", factory.callback(user_id, SOURCE.new(source="instagram"))))
+    steps += [
+        ("email", factory.message(user_id, f"bench{user_id}@example.com")),
+        ("telegram", factory.message(user_id, f"@bench{user_id}")),
+        ("books", factory.message(user_id, "1\n2\n3")),
+        ("pay", factory.callback(user_id, PAY.new(months=1, user_id=user_id))),
+        ("receipt", factory.message(user_id, "чек")),
+        ("approve", factory.callback(ADMIN_ID, PAYMENT_APPROVE.new(user_id=user_id, bonus=0), "Янги тўлов")),
+    ]
+    return steps
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def summarize(latencies):
+    return {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 1) if latencies else 0.0,
+    }
+
+
+async def post_update(session, url, update, latencies, step, errors):
+    started = time.perf_counter()
+    try:
+        async with session.post(url, json=update) as response:
+            await response.read()
+            if response.status != 200:
+                errors[step] += 1
+    except aiohttp.ClientError:
+        errors[step] += 1
+    latencies[step].append(time.perf_counter() - started)
+
+
+async def run_load(webhook_url, users, concurrency, admin_list_every, user_id_base):
+    factory = UpdateFactory()
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_user(i, session):
+        async with semaphore:
+            user_id = user_id_base + i
+            for step, update in user_scenario(factory, user_id, with_promo=i % 2 == 1):
+                await post_update(session, webhook_url, update, latencies, step, errors)
+            if admin_list_every and i % admin_list_every == 0:
+                await post_update(session, webhook_url, factory.message(ADMIN_ID, "/users"), latencies, "admin_users", errors)
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=120)) as session:
+        await asyncio.gather(*(run_user(i, session) for i in range(users)))
+    elapsed = time.perf_counter() - started
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "users": users,
+        "concurrency": concurrency,
+        "updates": len(all_latencies),
+        "errors": sum(errors.values()),
+        "duration_s": round(elapsed, 2),
+        "updates_per_s": round(len(all_latencies) / elapsed, 1) if elapsed else 0.0,
+        "total": summarize(all_latencies),
+        "steps": {step: summarize(values) for step, values in latencies.items()},
+    }
+
+
+async def wait_ready(url, timeout=60):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(url) as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.5)
+    raise RuntimeError(f"Бот не ответил на {url} за {timeout} сек.")
+
+
+async def start_bot(port, stub_url, extra_env):
+    env = dict(os.environ)
+    env.update({
+        "TOKEN": BENCH_TOKEN,
+        "ADMIN_IDS": str(ADMIN_ID),
+        "PORT": str(port),
+        "TELEGRAM_API_URL": stub_url,
+        "RENDER_EXTERNAL_HOSTNAME": f"127.0.0.1:{port}",
+        "LOG_LEVEL": env.get("LOG_LEVEL", "WARNING"),
+        # Синтетический пользователь проходит сценарий быстрее человека — без ограничения частоты
+        "THROTTLE_RATE": env.get("THROTTLE_RATE", "0"),
+    })
+    env.update(extra_env)
+    return await asyncio.create_subprocess_exec(sys.executable, "main.py", cwd=ROOT, env=env)
+
+
+def print_report(result, telegram):
+    total = result["total"]
+    print(f"Пользователей: {result['users']}, параллельно: {result['concurrency']}")
+    print(f"Обновлений: {result['updates']} за {result['duration_s']} сек. — {result['updates_per_s']} обн./сек., ошибок: {result['errors']}")
+    print(f"Задержка: p50 {total['p50_ms']} мс, p95 {total['p95_ms']} мс, p99 {total['p99_ms']} мс")
+    print(f"\n{'шаг':<20}{'n':>7}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for step, stats in result["steps"].items():
+        print(f"{step:<20}{stats['count']:>7}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+    if telegram["calls"]:
+        print("\nВызовы Bot API: " + ", ".join(f"{method}={count}" for method, count in sorted(telegram["calls"].items())))
+    if telegram["errors"]:
+        print("Ошибки Bot API: " + ", ".join(f"{code}={count}" for code, count in sorted(telegram["errors"].items())))
+
+
+async def main(args):
+    if not args.url and not os.getenv("DATABASE_URL"):
+        raise SystemExit("Укажите DATABASE_URL одноразовой базы PostgreSQL")
+    telegram = FakeTelegram(latency=args.latency, jitter=args.latency, rate_limit=args.rate_limit,
+                            blocked=args.blocked, seed=args.seed)
+    telegram_url = await telegram.start(port=args.telegram_port)
+
+    bot_process = None
+    base_url = args.url
+    try:
+        if not base_url:
+            extra_env = dict(item.split("=", 1) for item in args.env)
+            bot_process = await start_bot(args.port, telegram_url, extra_env)
+            base_url = f"http://127.0.0.1:{args.port}"
+        await wait_ready(f"{base_url}/readyz")
+        user_id_base = args.user_id_base or int(time.time()) * 1000
+        result = await run_load(f"{base_url}/webhook", args.users, args.concurrency, args.admin_list_every, user_id_base)
+    finally:
+        if bot_process is not None:
+            # Замена Bot API работает в этом же event loop, поэтому ждём бота асинхронно:
+            # при остановке он досылает очередь исходящих
+            bot_process.terminate()
+            await asyncio.wait_for(bot_process.wait(), timeout=30)
+        await telegram.stop()
+    result["telegram"] = telegram.summary()
+    print_report(result, result["telegram"])
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест webhook бота")
+    parser.add_argument("--users", type=int, default=100, help="число синтетических пользователей")
+    parser.add_argument("--concurrency", type=int, default=10, help="пользователей одновременно")
+    parser.add_argument("--admin-list-every", type=int, default=10, help="/users от админа на каждого N-го пользователя (0 — не отправлять)")
+    parser.add_argument("--port", type=int, default=18080, help="порт бота")
+    parser.add_argument("--telegram-port", type=int, default=18081, help="порт замены Bot API")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа Bot API, сек. (плюс случайная до того же значения)")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="доля отправок с ответом 429")
+    parser.add_argument("--blocked", type=float, default=0.0, help="доля чатов, заблокировавших бота (403)")
+    parser.add_argument("--seed", type=int, default=0, help="seed для воспроизводимых ошибок")
+    parser.add_argument("--url", help="адрес уже запущенного бота (тогда main.py не запускается)")
+    parser.add_argument("--user-id-base", type=int, help="первый user_id синтетических пользователей")
+    parser.add_argument("--env", action="append", default=[], help="переменная окружения для бота, KEY=VALUE")
+    parser.add_argument("--json", help="сохранить результат в JSON")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,130 @@
+# broadcast.py
+import asyncio
+import logging
+import time
+
+from aiogram.utils.exceptions import ChatNotFound, NetworkError, RetryAfter, TelegramAPIError, Unauthorized
+
+logger = logging.getLogger(__name__)
+
+
+# Token bucket: не больше rate отправок в секунду, всплеск до burst
+class RateLimiter:
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# Рассылка сообщений с ограничением параллелизма и лимитами Telegram.
+# Задание сначала сохраняется в broadcast_messages целиком, поэтому после падения
+# процесса неотправленные сообщения досылаются через resume_pending().
+class Broadcaster:
+    def __init__(self, bot, db, concurrency=10, global_rate=25, per_chat_interval=1.0, max_retries=5, flush_size=100):
+        self.bot = bot
+        self.db = db
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(global_rate)
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self.flush_size = flush_size
+        self._chat_next_at = {}
+
+    # items: итерируемое из (item_key, chat_id, text, reply_markup)
+    async def broadcast(self, job_id, items):
+        await self.db.enqueue_broadcast(job_id, [
+            (key, chat_id, text, reply_markup.as_json() if reply_markup else None)
+            for key, chat_id, text, reply_markup in items
+        ])
+        return await self.run(job_id)
+
+    # expired(job_id) -> True: рассылка устарела (например, вчерашние слова), неотправленные
+    # сообщения помечаются expired и не досылаются
+    async def resume_pending(self, expired=None):
+        for job_id in await self.db.get_pending_broadcast_jobs():
+            if expired is not None and expired(job_id):
+                await self.db.expire_broadcast(job_id)
+                logger.info(f"Рассылка {job_id} устарела, неотправленные сообщения не досылаются")
+                continue
+            logger.info(f"Возобновление рассылки {job_id}")
+            await self.run(job_id)
+
+    async def run(self, job_id):
+        pending = await self.db.get_pending_broadcast(job_id)
+        summary = {"job_id": job_id, "total": len(pending), "sent": 0, "blocked": 0, "failed": 0}
+        started = time.monotonic()
+        queue = asyncio.Queue()
+        for item in pending:
+            queue.put_nowait(item)
+        results = []
+
+        async def worker():
+            while True:
+                try:
+                    item_key, chat_id, text, reply_markup = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                status, error = await self._deliver(chat_id, text, reply_markup)
+                summary[status] += 1
+                results.append((job_id, item_key, status, error))
+                if len(results) >= self.flush_size:
+                    batch = results[:]
+                    results.clear()
+                    await self.db.update_broadcast_statuses(batch)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(pending)) or 1)))
+        if results:
+            await self.db.update_broadcast_statuses(results)
+        now = time.monotonic()
+        self._chat_next_at = {chat_id: at for chat_id, at in self._chat_next_at.items() if at > now}
+        summary["duration"] = round(time.monotonic() - started, 1)
+        logger.info(f"Рассылка завершена: {summary}")
+        return summary
+
+    async def _wait_for_chat(self, chat_id):
+        now = time.monotonic()
+        next_at = self._chat_next_at.get(chat_id, 0.0)
+        self._chat_next_at[chat_id] = max(now, next_at) + self.per_chat_interval
+        if next_at > now:
+            await asyncio.sleep(next_at - now)
+
+    async def _deliver(self, chat_id, text, reply_markup):
+        error = None
+        for attempt in range(self.max_retries):
+            await self._wait_for_chat(chat_id)
+            await self.limiter.acquire()
+            try:
+                await self.bot.send_message(chat_id, text, reply_markup=reply_markup)
+                return "sent", None
+            except RetryAfter as e:
+                logger.warning(f"Flood control при рассылке, пауза {e.timeout} сек.")
+                self.limiter.pause(e.timeout)
+                error = str(e)
+            except (Unauthorized, ChatNotFound) as e:
+                return "blocked", str(e)
+            except NetworkError as e:
+                await asyncio.sleep(2 ** attempt)
+                error = str(e)
+            except TelegramAPIError as e:
+                return "failed", str(e)
+        return "failed", error
@@ -0,0 +1,161 @@
+# callbacks.py
+import inspect
+import logging
+
+from aiogram.dispatcher.filters.builtin import StateFilter
+
+logger = logging.getLogger(__name__)
+
+# Версия формата callback_data: меняется, если меняется кодирование полей
+VERSION = "1"
+SEPARATOR = ":"
+# Ограничение Telegram на callback_data, в байтах
+MAX_LENGTH = 64
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+# Числа (user_id, id сообщений, курсоры) кодируются в base36 — в 1,5 раза короче десятичной записи
+def encode_int(value):
+    if value < 0:
+        return "-" + encode_int(-value)
+    digits = ""
+    while True:
+        value, rest = divmod(value, 36)
+        digits = _DIGITS[rest] + digits
+        if not value:
+            return digits
+
+
+# Тип callback_data: короткий код действия и типизированные поля (int или str).
+# Формат: <версия><код>:<поле>:<поле>..., например PAY.new(months=1, user_id=123) -> "1p:1:3f"
+class CallbackAction:
+    def __init__(self, code, **fields):
+        self.code = code
+        self.prefix = VERSION + code
+        self.fields = fields
+
+    def new(self, **values):
+        parts = [self.prefix]
+        for name, kind in self.fields.items():
+            value = values[name]
+            if kind is int:
+                parts.append(encode_int(int(value)))
+            else:
+                value = str(value)
+                if SEPARATOR in value:
+                    raise ValueError(f"Поле {name} не может содержать '{SEPARATOR}': {value!r}")
+                parts.append(value)
+        data = SEPARATOR.join(parts)
+        if len(data.encode()) > MAX_LENGTH:
+            raise ValueError(f"callback_data длиннее {MAX_LENGTH} байт: {data!r}")
+        return data
+
+    def parse(self, values):
+        if len(values) != len(self.fields):
+            raise ValueError(f"Ожидалось полей: {len(self.fields)}, получено: {len(values)}")
+        return {
+            name: int(value, 36) if kind is int else value
+            for (name, kind), value in zip(self.fields.items(), values)
+        }
+
+
+START_REGISTRATION = CallbackAction("s")
+SOURCE = CallbackAction("src", source=str)
+PAY = CallbackAction("p", months=int, user_id=int)
+PAYMENT_APPROVE = CallbackAction("pa", user_id=int, bonus=int)
+PAYMENT_REJECT = CallbackAction("pr", user_id=int)
+EXTEND_SUBSCRIPTION = CallbackAction("x")
+BACK_TO_MENU = CallbackAction("b")
+REPLY_TO = CallbackAction("r", user_id=int)
+RESET_BOOKS = CallbackAction("rb", user_id=int)
+USERS_PAGE = CallbackAction("u", direction=str, cursor=int, filters=str)
+HISTORY_PAGE = CallbackAction("h", direction=str, user_id=int, timestamp=int, message_id=int)
+
+# Кнопки в уже отправленных сообщениях (например, чеки у админов) в старом формате
+# "payment_approve_123_0": префикс без числового хвоста -> (действие, фиксированные поля).
+# Если фиксированных полей нет, числа из хвоста по порядку становятся полями действия.
+LEGACY_ACTIONS = {
+    "start_registration": (START_REGISTRATION, {}),
+    "source_instagram": (SOURCE, {"source": "instagram"}),
+    "source_teacher": (SOURCE, {"source": "teacher"}),
+    "pay": (PAY, None),
+    "payment_approve": (PAYMENT_APPROVE, None),
+    "payment_reject": (PAYMENT_REJECT, None),
+    "back_to_menu": (BACK_TO_MENU, {}),
+    "reply_to": (REPLY_TO, None),
+    "reset_books": (RESET_BOOKS, None),
+}
+
+
+class _Route:
+    def __init__(self, action, handler, state_filter):
+        self.action = action
+        self.handler = handler
+        self.state_filter = state_filter
+        self.wants_state = "state" in inspect.signature(handler).parameters
+
+
+# Маршрутизация нажатий на кнопки: один обработчик callback_query в aiogram и таблица
+# префикс -> обработчик, поэтому выбор обработчика — один поиск в словаре, а не перебор
+# фильтров. Обработчик получает уже разобранные поля как именованные аргументы:
+#
+#   @callbacks.route(PAY)
+#   async def start_payment(callback_query, months, user_id, state): ...
+#
+# state, как и в aiogram: None — только без состояния FSM, "*" — в любом состоянии.
+class CallbackRouter:
+    def __init__(self, dispatcher, stale_text):
+        self.dispatcher = dispatcher
+        self.stale_text = stale_text
+        self._routes = {}
+        dispatcher.register_callback_query_handler(self._dispatch, self._resolve, state="*")
+
+    def route(self, action, state=None):
+        def decorator(handler):
+            if action.prefix in self._routes:
+                raise ValueError(f"Код callback_data {action.code!r} уже используется")
+            state_filter = None if state == "*" else StateFilter(self.dispatcher, state)
+            self._routes[action.prefix] = _Route(action, handler, state_filter)
+            return handler
+        return decorator
+
+    def resolve(self, data):
+        head, _, tail = data.partition(SEPARATOR)
+        route = self._routes.get(head)
+        if route is not None:
+            return route, route.action.parse(tail.split(SEPARATOR) if tail else [])
+        prefix = data.rstrip("0123456789_")
+        action, values = LEGACY_ACTIONS.get(prefix, (None, None))
+        route = self._routes.get(action.prefix) if action is not None else None
+        if route is None:
+            return None, None
+        if values is None:
+            numbers = [int(number) for number in data[len(prefix):].split("_") if number]
+            if len(numbers) != len(action.fields):
+                raise ValueError(f"Ожидалось полей: {len(action.fields)}, получено: {len(numbers)}")
+            values = dict(zip(action.fields, numbers))
+        return route, values
+
+    # Фильтр aiogram: результат попадает в data обработчика и middleware
+    async def _resolve(self, callback_query):
+        try:
+            route, values = self.resolve(callback_query.data or "")
+        except ValueError as e:
+            logger.warning(f"Неверный callback_data {callback_query.data!r}: {e}")
+            route, values = None, None
+        return {
+            "callback_route": route,
+            "callback_values": values,
+            "handler_name": route.handler.__name__ if route is not None else "stale_callback",
+        }
+
+    async def _dispatch(self, callback_query, state, callback_route, callback_values):
+        if callback_route is None:
+            await callback_query.answer(self.stale_text)
+            return
+        if callback_route.state_filter is not None and not await callback_route.state_filter.check(callback_query):
+            await callback_query.answer()
+            return
+        if callback_route.wants_state:
+            callback_values = dict(callback_values, state=state)
+        return await callback_route.handler(callback_query, **callback_values)
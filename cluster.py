@@ -0,0 +1,88 @@
+# cluster.py
+import asyncio
+import logging
+
+import asyncpg
+from aiogram.dispatcher.handler import CancelHandler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-lock лидера (единственный процесс, выполняющий фоновые задачи)
+LEADER_LOCK_KEY = 7_301_002
+
+
+# Пропускает повторно доставленные Telegram обновления (ретраи webhook).
+# update_id фиксируется в processed_updates до обработки, поэтому одно и то же
+# обновление обрабатывает только один воркер.
+class UpdateDeduplicationMiddleware(BaseMiddleware):
+    def __init__(self, db):
+        super().__init__()
+        self.db = db
+
+    async def on_pre_process_update(self, update, data):
+        if not await self.db.mark_update_processed(update.update_id):
+            logger.info("Повторное обновление пропущено: update_id=%s", update.update_id)
+            raise CancelHandler()
+
+
+# Сбрасывает отложенные изменения FSM в конце обработки каждого обновления,
+# чтобы следующее сообщение пользователя увидело новое состояние на любом воркере
+class StorageFlushMiddleware(BaseMiddleware):
+    def __init__(self, storage):
+        super().__init__()
+        self.storage = storage
+
+    async def on_post_process_update(self, update, results, data):
+        await self.storage.flush()
+
+
+# Выбор лидера через pg_try_advisory_lock на отдельном соединении.
+# Блокировка живёт, пока живо соединение: если лидер упал, её забирает другой воркер.
+class LeaderLock:
+    def __init__(self, dsn, key=LEADER_LOCK_KEY, retry_interval=30):
+        self.dsn = dsn
+        self.key = key
+        self.retry_interval = retry_interval
+        self.is_leader = False
+        self._conn = None
+        self._task = None
+
+    # on_elected запускает фоновые задачи лидера, on_demoted останавливает их при потере блокировки
+    def start(self, on_elected, on_demoted):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(on_elected, on_demoted))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+        self.is_leader = False
+
+    async def _run(self, on_elected, on_demoted):
+        while True:
+            try:
+                if self._conn is None or self._conn.is_closed():
+                    if self.is_leader:
+                        self.is_leader = False
+                        await on_demoted()
+                    self._conn = await asyncpg.connect(self.dsn)
+                if self.is_leader:
+                    # Соединение живо — значит, блокировка по-прежнему у нас
+                    await self._conn.fetchval("SELECT 1")
+                elif await self._conn.fetchval("SELECT pg_try_advisory_lock($1)", self.key):
+                    self.is_leader = True
+                    logger.info("Процесс выбран лидером")
+                    await on_elected()
+            except Exception as e:
+                logger.error(f"Ошибка при выборе лидера: {e}")
+                if self._conn is not None:
+                    self._conn.terminate()
+                    self._conn = None
+                if self.is_leader:
+                    self.is_leader = False
+                    await on_demoted()
+            await asyncio.sleep(self.retry_interval)
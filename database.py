@@ -0,0 +1,578 @@
+# database.py
+import logging
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
+
+import asyncpg
+
+from cache import TTLCache
+from migrate import run_migrations
+
+logger = logging.getLogger(__name__)
+
+# Порядок столбцов users, на который опираются обработчики (user[3], user[10], ...)
+USER_COLUMNS = "id, user_id, source, email, telegram, books, trial_end, payment_due, paid_months, payment_confirmed, promo_code, is_active"
+# Столбцы для админского списка /users и выгрузки
+LIST_USER_COLUMNS = "user_id, source, email, telegram, books, trial_end, payment_due, paid_months, payment_confirmed, promo_code, is_active"
+
+
+# Месячный раздел messages, в который попадает день day: (имя, первый день, первый день следующего месяца)
+def message_partition(day):
+    start = date(day.year, day.month, 1)
+    end = date(day.year + day.month // 12, day.month % 12 + 1, 1)
+    return f"messages_y{start:%Y}m{start:%m}", start, end
+
+
+# PostgreSQL база данных через Supabase (асинхронный пул соединений)
+class Database:
+    def __init__(self, dsn, min_size=1, max_size=10, user_cache_size=1024, user_cache_ttl=60, stats_cache_ttl=60):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool = None
+        # Кэш записей users по user_id; любая запись в users обновляет или сбрасывает его
+        self.user_cache = TTLCache(maxsize=user_cache_size, ttl=user_cache_ttl)
+        # Кэш результатов /stats и /promo_stats, чтобы админские дашборды не нагружали базу
+        self.stats_cache = TTLCache(maxsize=8, ttl=stats_cache_ttl)
+
+    async def connect(self):
+        try:
+            self.pool = await asyncpg.create_pool(self.dsn, min_size=self.min_size, max_size=self.max_size)
+            logger.info(f"Пул соединений PostgreSQL создан (min={self.min_size}, max={self.max_size})")
+            await run_migrations(self.pool)
+        except Exception as e:
+            logger.error(f"Ошибка подключения к базе данных: {e}")
+            raise
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+            logger.info("Пул соединений PostgreSQL закрыт")
+
+    # Соединение берётся из пула на время одного вызова и сразу возвращается
+    @asynccontextmanager
+    async def acquire(self):
+        async with self.pool.acquire() as conn:
+            yield conn
+
+    # Транзакция: commit при выходе из блока, rollback при исключении
+    @asynccontextmanager
+    async def transaction(self):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                yield conn
+
+    # Промокод списывается в том же запросе, что и регистрация: UPDATE проходит, только если
+    # код действует, лимит не исчерпан и пользователь ещё не зарегистрирован.
+    # today — дата по часовому поясу планировщика, с которой сравнивают trial_end задачи оплаты
+    async def add_user(self, user_id, source, email, telegram, books, promo_code=None, today=None):
+        try:
+            today = today or date.today()
+            async with self.acquire() as conn:
+                user = await conn.fetchrow(
+                    f'''WITH promo AS (
+                           UPDATE promo_codes SET used_count = used_count + 1
+                           WHERE upper(code) = upper($6)
+                             AND (max_uses IS NULL OR used_count < max_uses)
+                             AND (expires_at IS NULL OR expires_at >= $7)
+                             AND NOT EXISTS (SELECT 1 FROM users WHERE user_id = $1)
+                           RETURNING code, bonus_days
+                       )
+                       INSERT INTO users (user_id, source, email, telegram, books, trial_end, payment_due, promo_code, is_active)
+                       SELECT $1, $2, $3, $4, $5, trial_end, trial_end, (SELECT code FROM promo), 1
+                       FROM (SELECT $7::date + 3 + COALESCE((SELECT bonus_days FROM promo), 0) AS trial_end) t
+                       ON CONFLICT (user_id) DO NOTHING RETURNING {USER_COLUMNS}''',
+                    user_id, source, email, telegram, books, promo_code, today
+                )
+            self._refresh_user(user_id, user)
+            logger.debug("Добавлен пользователь: user_id=%s, source=%s, promo_code=%s", user_id, source, user[10] if user else None)
+            return user
+        except Exception as e:
+            logger.error(f"Ошибка при добавлении пользователя: {e}")
+            return None
+
+    def _refresh_user(self, user_id, user):
+        if user is not None:
+            self.user_cache.set(user_id, user)
+        else:
+            self.user_cache.invalidate(user_id)
+
+    async def get_user(self, user_id):
+        result = self.user_cache.get(user_id)
+        if result is not None:
+            return result
+        try:
+            async with self.acquire() as conn:
+                result = await conn.fetchrow(f"SELECT {USER_COLUMNS} FROM users WHERE user_id = $1", user_id)
+            if result is not None:
+                self.user_cache.set(user_id, result)
+            logger.debug("Поиск пользователя: user_id=%s, найден=%s", user_id, result is not None)
+            return result
+        except Exception as e:
+            logger.error(f"Ошибка при получении пользователя: {e}")
+            return None
+
+    async def update_payment(self, user_id, months, bonus=0, today=None):
+        try:
+            total = months + bonus
+            today = today or date.today()
+            async with self.acquire() as conn:
+                user = await conn.fetchrow(
+                    f"UPDATE users SET paid_months = paid_months + $1, payment_confirmed = 1, payment_due = $2, is_active = 1 WHERE user_id = $3 RETURNING {USER_COLUMNS}",
+                    total, today + timedelta(days=30 * total), user_id
+                )
+            self._refresh_user(user_id, user)
+            logger.info("Обновлена оплата: user_id=%s, months=%s, bonus=%s", user_id, months, bonus)
+        except Exception as e:
+            logger.error(f"Ошибка при обновлении оплаты: {e}")
+
+    async def deactivate_user(self, user_id):
+        try:
+            async with self.acquire() as conn:
+                user = await conn.fetchrow(f"UPDATE users SET is_active = 0 WHERE user_id = $1 RETURNING {USER_COLUMNS}", user_id)
+            self._refresh_user(user_id, user)
+            logger.info("Пользователь деактивирован: user_id=%s", user_id)
+        except Exception as e:
+            logger.error(f"Ошибка при деактивации пользователя: {e}")
+
+    async def reset_books(self, user_id):
+        try:
+            async with self.acquire() as conn:
+                user = await conn.fetchrow(f"UPDATE users SET books = NULL WHERE user_id = $1 RETURNING {USER_COLUMNS}", user_id)
+            self._refresh_user(user_id, user)
+            logger.debug("Книги сброшены для user_id=%s", user_id)
+        except Exception as e:
+            logger.error(f"Ошибка при сбросе книг: {e}")
+
+    async def update_books(self, user_id, books):
+        try:
+            async with self.acquire() as conn:
+                user = await conn.fetchrow(f"UPDATE users SET books = $1, books_since = CURRENT_DATE WHERE user_id = $2 RETURNING {USER_COLUMNS}", books, user_id)
+            self._refresh_user(user_id, user)
+            logger.debug("Книги обновлены для user_id=%s", user_id)
+        except Exception as e:
+            logger.error(f"Ошибка при обновлении книг: {e}")
+
+    async def get_promo_codes(self):
+        try:
+            async with self.acquire() as conn:
+                return await conn.fetch("SELECT code, bonus_days, used_count, max_uses, expires_at FROM promo_codes")
+        except Exception as e:
+            logger.error(f"Ошибка при получении промокодов: {e}")
+            return None
+
+    # Промокоды вместе с числом оплативших по каждому коду (конверсия)
+    async def get_promo_stats(self):
+        stats = self.stats_cache.get("promo_stats")
+        if stats is not None:
+            return stats
+        try:
+            async with self.acquire() as conn:
+                stats = await conn.fetch('''SELECT p.code, p.teacher_name, p.used_count, p.bonus_days,
+                        COUNT(u.user_id) FILTER (WHERE u.payment_confirmed = 1) AS paid
+                    FROM promo_codes p LEFT JOIN users u ON u.promo_code = p.code
+                    GROUP BY p.code ORDER BY p.code''')
+            self.stats_cache.set("promo_stats", stats)
+            return stats
+        except Exception as e:
+            logger.error(f"Ошибка при получении статистики промокодов: {e}")
+            return []
+
+    # Деактивирует всех неоплативших с payment_due <= day одним запросом и возвращает их.
+    # Сравнение "<=" подхватывает и дни, когда ежедневная проверка не запускалась.
+    async def expire_unpaid_users(self, day):
+        try:
+            async with self.transaction() as conn:
+                rows = await conn.fetch(
+                    "UPDATE users SET is_active = 0 WHERE payment_due <= $1 AND payment_confirmed = 0 AND is_active = 1 RETURNING user_id, email, telegram",
+                    day
+                )
+            for row in rows:
+                self.user_cache.invalidate(row[0])
+            logger.info(f"Деактивировано пользователей с истёкшей оплатой: {len(rows)}")
+            return rows
+        except Exception as e:
+            logger.error(f"Ошибка при деактивации пользователей без оплаты: {e}")
+            return []
+
+    async def get_users_near_trial_end(self, day):
+        try:
+            async with self.acquire() as conn:
+                return await conn.fetch("SELECT user_id, email, telegram FROM users WHERE trial_end = $1 AND payment_confirmed = 0 AND is_active = 1", day)
+        except Exception as e:
+            logger.error(f"Ошибка при получении пользователей с истекающим пробным периодом: {e}")
+            return []
+
+    # Условия WHERE для списка пользователей по фильтрам из /users
+    @staticmethod
+    def _user_filter_clauses(filters, params):
+        clauses = []
+        if filters.get("active"):
+            clauses.append("is_active = 1")
+        if filters.get("inactive"):
+            clauses.append("is_active = 0")
+        if filters.get("unpaid"):
+            clauses.append("payment_confirmed = 0")
+        if filters.get("promo"):
+            params.append(filters["promo"])
+            clauses.append(f"upper(promo_code) = upper(${len(params)})")
+        if filters.get("source"):
+            params.append(filters["source"])
+            clauses.append(f"source = ${len(params)}")
+        if filters.get("date_from"):
+            params.append(filters["date_from"])
+            clauses.append(f"created_at >= ${len(params)}")
+        if filters.get("date_to"):
+            params.append(filters["date_to"] + timedelta(days=1))
+            clauses.append(f"created_at < ${len(params)}")
+        return clauses
+
+    # Страница списка пользователей с keyset-пагинацией по id.
+    # after — id последней записи предыдущей страницы, before — id первой записи следующей.
+    # Возвращает (rows, has_prev, has_next); в каждой строке первым идёт id.
+    async def list_users_page(self, filters, after=None, before=None, limit=10):
+        params = []
+        clauses = self._user_filter_clauses(filters, params)
+        if before is not None:
+            params.append(before)
+            clauses.append(f"id < ${len(params)}")
+            order = "DESC"
+        else:
+            params.append(after or 0)
+            clauses.append(f"id > ${len(params)}")
+            order = "ASC"
+        params.append(limit + 1)
+        query = (
+            f"SELECT id, {LIST_USER_COLUMNS} FROM users WHERE {' AND '.join(clauses)} "
+            f"ORDER BY id {order} LIMIT ${len(params)}"
+        )
+        try:
+            async with self.acquire() as conn:
+                rows = await conn.fetch(query, *params)
+        except Exception as e:
+            logger.error(f"Ошибка при получении списка пользователей: {e}")
+            return [], False, False
+        more = len(rows) > limit
+        rows = rows[:limit]
+        if before is not None:
+            return rows[::-1], more, True
+        return rows, after is not None, more
+
+    # Потоковый обход пользователей через серверный курсор: в памяти одновременно
+    # находится не больше batch_size строк
+    async def iter_users(self, filters, batch_size=500):
+        params = []
+        clauses = self._user_filter_clauses(filters, params) or ["TRUE"]
+        query = f"SELECT {LIST_USER_COLUMNS}, created_at FROM users WHERE {' AND '.join(clauses)} ORDER BY id"
+        async with self.transaction() as conn:
+            async for row in conn.cursor(query, *params, prefetch=batch_size):
+                yield row
+
+    # Вся статистика одним проходом по users: общие итоги плюс разбивка по источнику и промокоду
+    async def get_stats(self):
+        stats = self.stats_cache.get("stats")
+        if stats is not None:
+            return stats
+        stats = {"total": 0, "active": 0, "inactive": 0, "paid": 0, "trial": 0, "promo": 0, "by_source": [], "by_promo": []}
+        try:
+            async with self.acquire() as conn:
+                rows = await conn.fetch('''SELECT source, promo_code, GROUPING(source, promo_code) AS grouping,
+                        COUNT(*) AS total,
+                        COUNT(*) FILTER (WHERE is_active = 1) AS active,
+                        COUNT(*) FILTER (WHERE payment_confirmed = 1) AS paid,
+                        COUNT(*) FILTER (WHERE payment_confirmed = 0 AND is_active = 1) AS trial,
+                        COUNT(*) FILTER (WHERE promo_code IS NOT NULL) AS promo
+                    FROM users
+                    GROUP BY GROUPING SETS ((), (source), (promo_code))
+                    ORDER BY total DESC''')
+            for row in rows:
+                if row["grouping"] == 3:
+                    stats.update(
+                        total=row["total"], active=row["active"], inactive=row["total"] - row["active"],
+                        paid=row["paid"], trial=row["trial"], promo=row["promo"]
+                    )
+                elif row["grouping"] == 1:
+                    stats["by_source"].append((row["source"], row["total"], row["paid"]))
+                elif row["promo_code"] is not None:
+                    stats["by_promo"].append((row["promo_code"], row["total"], row["paid"]))
+            self.stats_cache.set("stats", stats)
+            return stats
+        except Exception as e:
+            logger.error(f"Ошибка при получении статистики: {e}")
+            return stats
+
+    # Получатели ежедневных слов постранично по id: (id, user_id, books, books_since)
+    async def get_vocabulary_recipients(self, after_id=0, limit=1000):
+        async with self.acquire() as conn:
+            return await conn.fetch(
+                '''SELECT id, user_id, books, COALESCE(books_since, created_at::date, CURRENT_DATE) AS books_since
+                   FROM users WHERE is_active = 1 AND books <> '' AND id > $1 ORDER BY id LIMIT $2''',
+                after_id, limit
+            )
+
+    # rows: (user_id, message_text, is_from_user, timestamp); ошибка пробрасывается,
+    # чтобы MessageLog мог сохранить пакет в spool
+    async def add_messages(self, rows):
+        async with self.acquire() as conn:
+            await conn.copy_records_to_table(
+                "messages", records=rows, columns=["user_id", "message_text", "is_from_user", "timestamp"]
+            )
+        logger.debug("Сохранено сообщений: %s", len(rows))
+
+    # Страница переписки с пользователем по ключу (timestamp, id), строки в хронологическом порядке.
+    # Без курсора — последние limit сообщений; before/after — курсор (timestamp, id) соседней страницы.
+    # Возвращает (rows, есть_старее, есть_новее)
+    async def get_user_messages(self, user_id, before=None, after=None, limit=10):
+        params = [user_id]
+        condition, order = "", "DESC"
+        if after is not None:
+            params.extend(after)
+            condition, order = "AND (timestamp, id) > ($2, $3)", "ASC"
+        elif before is not None:
+            params.extend(before)
+            condition = "AND (timestamp, id) < ($2, $3)"
+        params.append(limit + 1)
+        query = (
+            f"SELECT id, message_text, is_from_user, timestamp FROM messages WHERE user_id = $1 {condition} "
+            f"ORDER BY timestamp {order}, id {order} LIMIT ${len(params)}"
+        )
+        try:
+            async with self.acquire() as conn:
+                rows = await conn.fetch(query, *params)
+        except Exception as e:
+            logger.error(f"Ошибка при получении сообщений пользователя: {e}")
+            return [], False, False
+        more = len(rows) > limit
+        rows = rows[:limit]
+        if after is not None:
+            return rows, True, more
+        return rows[::-1], more, before is not None
+
+    # Разделы messages (messages_yГГГГmММ), от старых к новым
+    async def get_message_partitions(self):
+        async with self.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = 'messages'::regclass ORDER BY c.relname"
+            )
+        return [row[0] for row in rows]
+
+    # Новый раздел создаётся отдельной таблицей и подключается через ATTACH: строки этого
+    # месяца, попавшие в messages_default, переносятся в него в той же транзакции
+    async def create_message_partition(self, month):
+        name, start, end = message_partition(month)
+        async with self.transaction() as conn:
+            if await conn.fetchval("SELECT to_regclass($1)", name) is not None:
+                return name
+            await conn.execute(f"CREATE TABLE {name} (LIKE messages INCLUDING DEFAULTS)")
+            await conn.execute(
+                f'''WITH moved AS (
+                       DELETE FROM messages_default WHERE timestamp >= $1 AND timestamp < $2 RETURNING *
+                   )
+                   INSERT INTO {name} SELECT * FROM moved''',
+                start, end
+            )
+            await conn.execute(f"ALTER TABLE messages ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')")
+        return name
+
+    # Выгрузка раздела в output (COPY ... CSV с заголовком); возвращает число строк
+    async def export_message_partition(self, name, output):
+        async with self.acquire() as conn:
+            status = await conn.copy_from_table(
+                name, columns=["id", "user_id", "message_text", "is_from_user", "timestamp"],
+                output=output, format="csv", header=True
+            )
+        return int(status.split()[-1])
+
+    # Удаляет раздел, только если в нём по-прежнему exported строк: если после выгрузки
+    # в него что-то записали, раздел остаётся до следующего запуска
+    async def drop_message_partition(self, name, exported):
+        async with self.transaction() as conn:
+            await conn.execute(f"LOCK TABLE {name} IN SHARE MODE")
+            if await conn.fetchval(f"SELECT COUNT(*) FROM {name}") != exported:
+                return False
+            await conn.execute(f"ALTER TABLE messages DETACH PARTITION {name}")
+            await conn.execute(f"DROP TABLE {name}")
+        return True
+
+    async def enqueue_broadcast(self, job_id, items):
+        try:
+            async with self.transaction() as conn:
+                await conn.executemany(
+                    "INSERT INTO broadcast_messages (job_id, item_key, chat_id, message_text, reply_markup) VALUES ($1, $2, $3, $4, $5) ON CONFLICT (job_id, item_key) DO NOTHING",
+                    [(job_id, key, chat_id, text, reply_markup) for key, chat_id, text, reply_markup in items]
+                )
+            logger.info(f"Рассылка {job_id}: поставлено в очередь {len(items)} сообщений")
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении рассылки {job_id}: {e}")
+            raise
+
+    async def get_pending_broadcast(self, job_id):
+        try:
+            async with self.acquire() as conn:
+                return await conn.fetch(
+                    "SELECT item_key, chat_id, message_text, reply_markup FROM broadcast_messages WHERE job_id = $1 AND status = 'pending' ORDER BY created_at, item_key",
+                    job_id
+                )
+        except Exception as e:
+            logger.error(f"Ошибка при получении рассылки {job_id}: {e}")
+            return []
+
+    async def get_pending_broadcast_jobs(self):
+        try:
+            async with self.acquire() as conn:
+                rows = await conn.fetch("SELECT DISTINCT job_id FROM broadcast_messages WHERE status = 'pending'")
+            return [row[0] for row in rows]
+        except Exception as e:
+            logger.error(f"Ошибка при получении незавершённых рассылок: {e}")
+            return []
+
+    async def update_broadcast_statuses(self, results):
+        try:
+            async with self.acquire() as conn:
+                await conn.executemany(
+                    "UPDATE broadcast_messages SET status = $3, error = $4, updated_at = CURRENT_TIMESTAMP WHERE job_id = $1 AND item_key = $2",
+                    results
+                )
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении статусов рассылки: {e}")
+
+    async def expire_broadcast(self, job_id):
+        try:
+            async with self.acquire() as conn:
+                await conn.execute(
+                    "UPDATE broadcast_messages SET status = 'expired', updated_at = CURRENT_TIMESTAMP WHERE job_id = $1 AND status = 'pending'",
+                    job_id
+                )
+        except Exception as e:
+            logger.error(f"Ошибка при отмене рассылки {job_id}: {e}")
+
+    # Завершённые сообщения рассылок (с полным текстом) хранятся days дней; pending не трогаем
+    async def delete_old_broadcast_messages(self, days=7):
+        try:
+            async with self.acquire() as conn:
+                await conn.execute(
+                    "DELETE FROM broadcast_messages WHERE status <> 'pending' AND updated_at < CURRENT_TIMESTAMP - make_interval(days => $1)",
+                    days
+                )
+        except Exception as e:
+            logger.error(f"Ошибка при очистке broadcast_messages: {e}")
+
+    # True, если update_id встретился впервые; False — если его уже обработал какой-либо воркер
+    async def mark_update_processed(self, update_id):
+        try:
+            async with self.acquire() as conn:
+                inserted = await conn.fetchval(
+                    "INSERT INTO processed_updates (update_id) VALUES ($1) ON CONFLICT (update_id) DO NOTHING RETURNING update_id",
+                    update_id
+                )
+            return inserted is not None
+        except Exception as e:
+            logger.error(f"Ошибка при отметке обновления {update_id}: {e}")
+            return True
+
+    async def delete_old_processed_updates(self, days=2):
+        try:
+            async with self.acquire() as conn:
+                await conn.execute("DELETE FROM processed_updates WHERE processed_at < CURRENT_TIMESTAMP - make_interval(days => $1)", days)
+        except Exception as e:
+            logger.error(f"Ошибка при очистке processed_updates: {e}")
+
+    async def ping(self, timeout=2):
+        if self.pool is None:
+            return False
+        try:
+            async with self.pool.acquire(timeout=timeout) as conn:
+                await conn.fetchval("SELECT 1", timeout=timeout)
+            return True
+        except Exception as e:
+            logger.error(f"База данных недоступна: {e}")
+            return False
+
+    # Регистрирует задачи планировщика; next_run сохраняется, если расписание не менялось,
+    # чтобы пропущенный во время простоя запуск был выполнен после старта
+    async def register_scheduled_jobs(self, jobs):
+        try:
+            async with self.acquire() as conn:
+                await conn.executemany(
+                    '''INSERT INTO scheduled_jobs (name, schedule, next_run) VALUES ($1, $2, $3)
+                       ON CONFLICT (name) DO UPDATE SET schedule = EXCLUDED.schedule,
+                           next_run = CASE WHEN scheduled_jobs.schedule = EXCLUDED.schedule AND scheduled_jobs.next_run IS NOT NULL
+                                           THEN scheduled_jobs.next_run ELSE EXCLUDED.next_run END''',
+                    jobs
+                )
+        except Exception as e:
+            logger.error(f"Ошибка при регистрации задач планировщика: {e}")
+            raise
+
+    async def get_due_jobs(self, names, now):
+        async with self.acquire() as conn:
+            return await conn.fetch(
+                "SELECT name, next_run FROM scheduled_jobs WHERE name = ANY($1::text[]) AND next_run <= $2 ORDER BY next_run",
+                names, now
+            )
+
+    # Условный UPDATE: запуск получает только тот процесс, который первым сдвинул next_run
+    async def claim_scheduled_job(self, name, next_run, new_next_run):
+        async with self.acquire() as conn:
+            claimed = await conn.fetchval(
+                "UPDATE scheduled_jobs SET next_run = $3, last_run = CURRENT_TIMESTAMP, last_status = 'running' WHERE name = $1 AND next_run = $2 RETURNING name",
+                name, next_run, new_next_run
+            )
+        return claimed is not None
+
+    async def finish_scheduled_job(self, name, error=None):
+        try:
+            async with self.acquire() as conn:
+                await conn.execute(
+                    "UPDATE scheduled_jobs SET last_finished = CURRENT_TIMESTAMP, last_status = $2, last_error = $3 WHERE name = $1",
+                    name, "failed" if error else "ok", error
+                )
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении результата задачи {name}: {e}")
+
+    # Пользователи, у которых пробный период заканчивается в [today, until]; отметка ставится
+    # в том же запросе, поэтому напоминание уходит один раз
+    async def claim_trial_reminders(self, today, until):
+        try:
+            async with self.transaction() as conn:
+                return await conn.fetch(
+                    '''UPDATE users SET trial_reminder_sent_at = CURRENT_TIMESTAMP
+                       WHERE trial_end >= $1 AND trial_end <= $2
+                         AND trial_reminder_sent_at IS NULL AND payment_confirmed = 0 AND is_active = 1
+                       RETURNING user_id, email, telegram, trial_end''',
+                    today, until
+                )
+        except Exception as e:
+            logger.error(f"Ошибка при выборке напоминаний о пробном периоде: {e}")
+            return []
+
+    async def add_dead_letter(self, chat_id, method, payload, error, attempts):
+        try:
+            async with self.acquire() as conn:
+                await conn.execute(
+                    "INSERT INTO dead_letters (chat_id, method, payload, error, attempts) VALUES ($1, $2, $3::jsonb, $4, $5)",
+                    chat_id, method, payload, error, attempts
+                )
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении недоставленного сообщения для {chat_id}: {e}")
+
+    async def get_media_asset(self, name):
+        try:
+            async with self.acquire() as conn:
+                return await conn.fetchrow("SELECT checksum, file_id FROM media_assets WHERE name = $1", name)
+        except Exception as e:
+            logger.error(f"Ошибка при получении file_id для {name}: {e}")
+            return None
+
+    async def save_media_asset(self, name, checksum, file_id):
+        try:
+            async with self.acquire() as conn:
+                await conn.execute(
+                    '''INSERT INTO media_assets (name, checksum, file_id) VALUES ($1, $2, $3)
+                       ON CONFLICT (name) DO UPDATE SET checksum = EXCLUDED.checksum, file_id = EXCLUDED.file_id,
+                           updated_at = CURRENT_TIMESTAMP''',
+                    name, checksum, file_id
+                )
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении file_id для {name}: {e}")
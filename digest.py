@@ -0,0 +1,104 @@
+# digest.py
+import asyncio
+import logging
+
+from aiogram.types import InlineKeyboardMarkup
+from aiogram.utils.exceptions import RetryAfter, TelegramAPIError
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_LIMIT = 4096
+SEPARATOR = "\n\n———\n\n"
+
+
+# Накопитель уведомлений для админов: вместо отдельного сообщения на каждое событие
+# каждый админ получает одну сводку раз в interval секунд или при max_items записях
+class AdminDigest:
+    def __init__(self, bot, admin_ids, interval=60, max_items=20):
+        self.bot = bot
+        self.admin_ids = admin_ids
+        self.interval = interval
+        self.max_items = max_items
+        self._items = []
+        self._task = None
+        self._flush_task = None
+        self._flush_lock = asyncio.Lock()
+
+    # button — необязательная inline-кнопка, которая попадёт под сводку (например, «Жавоб бериш»)
+    def add(self, text, button=None):
+        self._items.append((text, button))
+        # Не больше одной внеочередной отправки: она заберёт и записи, добавленные пока она ждёт
+        if len(self._items) >= self.max_items and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self._flush_full())
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        # Внеочередная отправка должна закончиться до закрытия бота в on_shutdown
+        if self._flush_task is not None:
+            await self._flush_task
+            self._flush_task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка при отправке сводки админам: {e}")
+
+    async def _flush_full(self):
+        try:
+            while len(self._items) >= self.max_items:
+                await self.flush()
+        except Exception as e:
+            logger.error(f"Ошибка при отправке сводки админам: {e}")
+
+    async def flush(self):
+        async with self._flush_lock:
+            items, self._items = self._items, []
+            if not items:
+                return
+            for text, reply_markup in self._build_chunks(items):
+                for admin_id in self.admin_ids:
+                    await self._send(admin_id, text, reply_markup)
+            logger.info(f"Сводка для админов отправлена: {len(items)} записей")
+
+    def _build_chunks(self, items):
+        chunks = []
+        texts, buttons, size = [], [], 0
+        for text, button in items:
+            text = text[:MESSAGE_LIMIT - 100]
+            if texts and size + len(SEPARATOR) + len(text) > MESSAGE_LIMIT - 100:
+                chunks.append((texts, buttons))
+                texts, buttons, size = [], [], 0
+            texts.append(text)
+            size += len(text) + len(SEPARATOR)
+            if button is not None:
+                buttons.append(button)
+        if texts:
+            chunks.append((texts, buttons))
+
+        result = []
+        for texts, buttons in chunks:
+            header = f"🗂 Сводка ({len(texts)}):\n\n"
+            markup = InlineKeyboardMarkup(row_width=2).add(*buttons) if buttons else None
+            result.append((header + SEPARATOR.join(texts), markup))
+        return result
+
+    async def _send(self, admin_id, text, reply_markup):
+        for _ in range(3):
+            try:
+                await self.bot.send_message(admin_id, text, reply_markup=reply_markup)
+                return
+            except RetryAfter as e:
+                await asyncio.sleep(e.timeout)
+            except TelegramAPIError as e:
+                logger.error(f"Не удалось отправить сводку админу {admin_id}: {e}")
+                return
@@ -0,0 +1,140 @@
+# fake_telegram.py
+import asyncio
+import itertools
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+BOT_USER = {"id": 100000001, "is_bot": True, "first_name": "Wordzen", "username": "wordzen_fake_bot"}
+# Методы, которые отправляют сообщение пользователю: к ним применяются 429 и 403
+SEND_METHODS = {"sendMessage", "sendPhoto", "sendDocument", "copyMessage", "forwardMessage"}
+
+
+# Локальная замена Bot API для офлайн-тестов и профилирования.
+# Записывает все вызовы, добавляет задержку latency (+ случайная до jitter секунд)
+# и с заданной вероятностью отвечает 429 (retry_after) или 403 «bot was blocked»
+# на отправку сообщений. Чаты из blocked_chats всегда отвечают 403.
+# Случайность с фиксированным seed, поэтому прогоны воспроизводимы.
+class FakeTelegram:
+    def __init__(self, latency=0.0, jitter=0.0, rate_limit=0.0, retry_after=1, blocked=0.0,
+                 blocked_chats=(), seed=0, max_calls=100000):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.blocked = blocked
+        self.blocked_chats = set(blocked_chats)
+        self.max_calls = max_calls
+        self.random = random.Random(seed)
+        self.calls = []
+        self.counts = Counter()
+        self.errors = Counter()
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        self._runner = None
+
+    # Конфигурация строкой, например FAKE_TELEGRAM="latency=0.05,rate_limit=0.01,blocked=0.02,seed=1"
+    @classmethod
+    def from_config(cls, config):
+        options = {}
+        for item in filter(None, config.split(",")):
+            key, _, value = item.partition("=")
+            key = key.strip()
+            if key == "blocked_chats":
+                options[key] = [int(chat_id) for chat_id in value.split(":") if chat_id]
+            elif key in ("seed", "retry_after", "max_calls"):
+                options[key] = int(value)
+            elif key in ("latency", "jitter", "rate_limit", "blocked"):
+                options[key] = float(value)
+        return cls(**options)
+
+    def make_app(self):
+        app = web.Application()
+        self.add_routes(app)
+        return app
+
+    # Маршруты на существующем приложении, например на сервере самого бота под prefix
+    def add_routes(self, app, prefix=""):
+        app.router.add_get(f"{prefix}/_calls", self.calls_view)
+        app.router.add_post(prefix + "/bot{token}/{method}", self.handle)
+
+    # Отдельный сервер (для бота в другом процессе); url подставляется в TELEGRAM_API_URL
+    async def start(self, host="127.0.0.1", port=8081):
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def reset(self):
+        self.calls.clear()
+        self.counts.clear()
+        self.errors.clear()
+
+    def calls_to(self, method, chat_id=None):
+        return [
+            params for name, params, _ in self.calls
+            if name == method and (chat_id is None or params.get("chat_id") == str(chat_id))
+        ]
+
+    def summary(self):
+        return {"calls": dict(self.counts), "errors": dict(self.errors)}
+
+    async def calls_view(self, request):
+        return web.json_response(self.summary())
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        self.counts[method] += 1
+        if len(self.calls) < self.max_calls:
+            self.calls.append((method, params, time.time()))
+
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+
+        if method in SEND_METHODS:
+            chat_id = int(params.get("chat_id", 0))
+            if self.rate_limit and self.random.random() < self.rate_limit:
+                self.errors["429"] += 1
+                return web.json_response({
+                    "ok": False, "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                }, status=429)
+            if chat_id in self.blocked_chats or (self.blocked and self.random.random() < self.blocked):
+                self.blocked_chats.add(chat_id)
+                self.errors["403"] += 1
+                return web.json_response({
+                    "ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user",
+                }, status=403)
+        return web.json_response({"ok": True, "result": self._result(method, params)})
+
+    def _result(self, method, params):
+        if method == "getMe":
+            return BOT_USER
+        if method == "getWebhookInfo":
+            return {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        if method.startswith("send") or method.startswith("edit") or method in ("copyMessage", "forwardMessage"):
+            message = {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "from": BOT_USER,
+            }
+            if method == "sendPhoto":
+                message["photo"] = [{"file_id": f"fake-photo-{next(self._file_ids)}", "file_unique_id": "fake", "width": 1, "height": 1}]
+                message["caption"] = params.get("caption", "")
+            elif method == "sendDocument":
+                message["document"] = {"file_id": f"fake-document-{next(self._file_ids)}", "file_unique_id": "fake"}
+            else:
+                message["text"] = params.get("text", "")
+            return message
+        return True
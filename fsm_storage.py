@@ -0,0 +1,205 @@
+# fsm_storage.py
+import asyncio
+import copy
+import json
+import logging
+import typing
+
+from aiogram.dispatcher.storage import BaseStorage
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+_EMPTY = {"state": None, "data": {}, "bucket": {}}
+
+
+# Хранилище состояний FSM в PostgreSQL (таблица fsm_states).
+# Запись отложенная: изменения копятся в памяти и раз в flush_interval секунд
+# сохраняются одним пакетом, поэтому смена состояния не добавляет запрос к базе.
+# Пакет, который сейчас записывается в базу, остаётся видимым для чтения (_flushing) до конца
+# транзакции: иначе запись, выпавшая из кэша, прочиталась бы из базы устаревшей и затёрла бы изменения.
+# Состояния, не обновлявшиеся дольше state_ttl секунд, считаются брошенными и удаляются.
+class PostgresStorage(BaseStorage):
+    def __init__(self, db, state_ttl=24 * 60 * 60, flush_interval=1.0, cache_size=10000, cache_ttl=30):
+        self.db = db
+        self.state_ttl = state_ttl
+        self.flush_interval = flush_interval
+        self._cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._dirty = {}
+        self._flushing = {}
+        self._task = None
+        self._flush_lock = asyncio.Lock()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    async def wait_closed(self):
+        pass
+
+    async def _run(self):
+        cleanup_every = max(1, int(60 / self.flush_interval))
+        ticks = 0
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                ticks += 1
+                if ticks % cleanup_every == 0:
+                    await self.delete_expired()
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении состояний FSM: {e}")
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, {}
+            self._flushing = dirty
+            upserts = [
+                (chat, user, record["state"], json.dumps(record["data"]), json.dumps(record["bucket"]))
+                for (chat, user), record in dirty.items() if record != _EMPTY
+            ]
+            deletes = [key for key, record in dirty.items() if record == _EMPTY]
+            try:
+                async with self.db.transaction() as conn:
+                    if upserts:
+                        await conn.executemany(
+                            '''INSERT INTO fsm_states (chat, "user", state, data, bucket, updated_at)
+                               VALUES ($1, $2, $3, $4::jsonb, $5::jsonb, CURRENT_TIMESTAMP)
+                               ON CONFLICT (chat, "user") DO UPDATE SET state = EXCLUDED.state, data = EXCLUDED.data,
+                                   bucket = EXCLUDED.bucket, updated_at = EXCLUDED.updated_at''',
+                            upserts
+                        )
+                    if deletes:
+                        await conn.execute(
+                            'DELETE FROM fsm_states WHERE (chat, "user") IN (SELECT * FROM unnest($1::text[], $2::text[]))',
+                            [chat for chat, _ in deletes], [user for _, user in deletes]
+                        )
+            except Exception:
+                # Не теряем изменения: вернём их в очередь, если их не перезаписали новее
+                for key, record in dirty.items():
+                    self._dirty.setdefault(key, record)
+                raise
+            finally:
+                self._flushing = {}
+
+    async def delete_expired(self):
+        async with self.db.acquire() as conn:
+            status = await conn.execute(
+                "DELETE FROM fsm_states WHERE updated_at < CURRENT_TIMESTAMP - make_interval(secs => $1)",
+                self.state_ttl
+            )
+        logger.info(f"Удалены брошенные состояния FSM: {status}")
+
+    async def count_states(self):
+        await self.flush()
+        async with self.db.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT state, COUNT(*) FROM fsm_states WHERE state IS NOT NULL AND updated_at >= CURRENT_TIMESTAMP - make_interval(secs => $1) GROUP BY state",
+                self.state_ttl
+            )
+        return {state: count for state, count in rows}
+
+    def _key(self, chat, user):
+        chat, user = self.check_address(chat=chat, user=user)
+        return str(chat), str(user)
+
+    async def _load(self, key):
+        record = self._dirty.get(key) or self._flushing.get(key) or self._cache.get(key)
+        if record is not None:
+            return record
+        async with self.db.acquire() as conn:
+            row = await conn.fetchrow(
+                '''SELECT state, data, bucket FROM fsm_states
+                   WHERE chat = $1 AND "user" = $2 AND updated_at >= CURRENT_TIMESTAMP - make_interval(secs => $3)''',
+                key[0], key[1], self.state_ttl
+            )
+        if row is None:
+            record = copy.deepcopy(_EMPTY)
+        else:
+            record = {"state": row["state"], "data": json.loads(row["data"]), "bucket": json.loads(row["bucket"])}
+        self._cache.set(key, record)
+        return record
+
+    async def _save(self, key, **changes):
+        record = dict(await self._load(key))
+        record.update(changes)
+        self._cache.set(key, record)
+        self._dirty[key] = record
+
+    async def get_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        default: typing.Optional[str] = None) -> typing.Optional[str]:
+        record = await self._load(self._key(chat, user))
+        return record["state"] or self.resolve_state(default)
+
+    async def get_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       default: typing.Optional[dict] = None) -> typing.Dict:
+        record = await self._load(self._key(chat, user))
+        return copy.deepcopy(record["data"]) or (default or {})
+
+    async def set_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        state: typing.AnyStr = None):
+        await self._save(self._key(chat, user), state=self.resolve_state(state))
+
+    async def set_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       data: typing.Dict = None):
+        await self._save(self._key(chat, user), data=copy.deepcopy(data or {}))
+
+    async def update_data(self, *,
+                          chat: typing.Union[str, int, None] = None,
+                          user: typing.Union[str, int, None] = None,
+                          data: typing.Dict = None, **kwargs):
+        key = self._key(chat, user)
+        merged = dict((await self._load(key))["data"])
+        merged.update(data or {}, **kwargs)
+        await self._save(key, data=merged)
+
+    async def reset_state(self, *,
+                          chat: typing.Union[str, int, None] = None,
+                          user: typing.Union[str, int, None] = None,
+                          with_data: typing.Optional[bool] = True):
+        changes = {"state": None}
+        if with_data:
+            changes["data"] = {}
+        await self._save(self._key(chat, user), **changes)
+
+    def has_bucket(self):
+        return True
+
+    async def get_bucket(self, *,
+                         chat: typing.Union[str, int, None] = None,
+                         user: typing.Union[str, int, None] = None,
+                         default: typing.Optional[dict] = None) -> typing.Dict:
+        record = await self._load(self._key(chat, user))
+        return copy.deepcopy(record["bucket"]) or (default or {})
+
+    async def set_bucket(self, *,
+                         chat: typing.Union[str, int, None] = None,
+                         user: typing.Union[str, int, None] = None,
+                         bucket: typing.Dict = None):
+        await self._save(self._key(chat, user), bucket=copy.deepcopy(bucket or {}))
+
+    async def update_bucket(self, *,
+                            chat: typing.Union[str, int, None] = None,
+                            user: typing.Union[str, int, None] = None,
+                            bucket: typing.Dict = None, **kwargs):
+        key = self._key(chat, user)
+        merged = dict((await self._load(key))["bucket"])
+        merged.update(bucket or {}, **kwargs)
+        await self._save(key, bucket=merged)
@@ -0,0 +1,116 @@
+# logging_setup.py
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+# Стандартные атрибуты LogRecord; всё остальное (extra=...) попадает в JSON как поля
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener = None
+_listener_pid = None
+
+
+# Одна JSON-строка на запись: время, уровень, логгер, процесс, сообщение и поля из extra
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "process": record.processName,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+# Ограничение частоты записей для каждого логгера (token bucket: rate в секунду, всплеск burst).
+# Отброшенные записи не форматируются; их число добавляется к следующей пропущенной записи.
+# Записи уровня ERROR и выше не ограничиваются.
+class RateLimitFilter(logging.Filter):
+    def __init__(self, rate=20, burst=100):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR or self.rate <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at, dropped = self._buckets.get(record.name, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            if tokens < 1:
+                self._buckets[record.name] = (tokens, now, dropped + 1)
+                return False
+            self._buckets[record.name] = (tokens - 1, now, 0)
+        if dropped:
+            record.suppressed = dropped
+        return True
+
+
+# QueueHandler без форматирования в вызывающем потоке: сообщение собирается
+# (record.getMessage) только в потоке QueueListener. Очередь внутрипроцессная,
+# поэтому записи можно передавать как есть.
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        return record
+
+
+# Логи пишет отдельный поток: обработчик в event loop только кладёт запись в очередь.
+# Вызывается повторно в каждом процессе-воркере — после fork поток слушателя не наследуется.
+def setup_logging(level=None, fmt=None, rate=None, burst=None):
+    global _listener, _listener_pid
+    if _listener is not None and _listener_pid == os.getpid():
+        return
+    level = level or os.getenv("LOG_LEVEL", "INFO")
+    fmt = fmt or os.getenv("LOG_FORMAT", "json")
+    rate = float(rate if rate is not None else os.getenv("LOG_RATE", 20))
+    burst = int(burst if burst is not None else os.getenv("LOG_BURST", 100))
+
+    stream = logging.StreamHandler(sys.stdout)
+    if fmt == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(processName)s - %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    handler = _LazyQueueHandler(log_queue)
+    handler.addFilter(RateLimitFilter(rate, burst))
+
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level)
+    # Уровни отдельных логгеров: LOG_LEVELS="aiohttp.access=WARNING,database=DEBUG"
+    for item in os.getenv("LOG_LEVELS", "").split(","):
+        name, _, logger_level = item.partition("=")
+        if name.strip() and logger_level.strip():
+            logging.getLogger(name.strip()).setLevel(logger_level.strip().upper())
+
+    # Слушатель родительского процесса после fork не работает — просто забываем его
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    _listener_pid = os.getpid()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    global _listener
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+        _listener = None
@@ -5,18 +5,44 @@
 # main.py (часть 1)
 import os
 import asyncio
+import csv
+import json
 import logging
+import multiprocessing
+import signal
+import tempfile
+import time
 from datetime import datetime, timedelta
-from aiogram import Bot, Dispatcher, types
+from aiogram import Dispatcher, types
+from aiogram.bot.api import TelegramAPIServer
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.dispatcher import FSMContext
+from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
-from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiogram.dispatcher.webhook import configure_app
 from aiohttp import web
-import psycopg2
-from keep_alive import keep_alive
-
-# Конфигурация логирования
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from broadcast import Broadcaster
+from callbacks import (
+    BACK_TO_MENU, EXTEND_SUBSCRIPTION, HISTORY_PAGE, PAY, PAYMENT_APPROVE, PAYMENT_REJECT, REPLY_TO, RESET_BOOKS,
+    SOURCE, START_REGISTRATION, USERS_PAGE, CallbackRouter,
+)
+from cluster import LeaderLock, StorageFlushMiddleware, UpdateDeduplicationMiddleware
+from database import Database
+from digest import AdminDigest
+from fake_telegram import FakeTelegram
+from fsm_storage import PostgresStorage
+from logging_setup import setup_logging, stop_logging
+from media import MediaRegistry
+from message_log import MessageArchive, MessageLog
+from promo import PromoIndex
+from metrics import REGISTRY, OUTBOUND_DEPTH, UPDATES_IN_FLIGHT, HandlerMetricsMiddleware, InstrumentedBot, fsm_states_collector, instrument_database
+from outbound import OutboundQueue
+from scheduler import CronSchedule, Scheduler
+from throttling import ThrottlingMiddleware
+from vocabulary import JOB_PREFIX as VOCABULARY_JOB_PREFIX, VocabularyDelivery, VocabularyIndex
+
+# Конфигурация логирования: запись в отдельном потоке, JSON (LOG_FORMAT=text — обычный текст)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Переменные окружения
@@ -25,218 +51,140 @@ ADMIN_IDS = [int(admin_id) for admin_id in os.getenv("ADMIN_IDS", "").split(",")
 if not ADMIN_IDS:
     raise ValueError("ADMIN_IDS не указаны в переменных окружения!")
 CARD_NUMBER = "1234 5678 9012 3456"
+USERS_PAGE_SIZE = int(os.getenv("USERS_PAGE_SIZE", 10))
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", 10))
+# Число процессов-воркеров за одним webhook (общий порт через SO_REUSEPORT)
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+MULTI_WORKER = WEB_CONCURRENCY > 1
+# Расписание фоновых задач (cron, по времени SCHEDULER_TZ)
+SCHEDULER_TZ = os.getenv("SCHEDULER_TZ", "Asia/Tashkent")
+CHECK_PAYMENTS_CRON = os.getenv("CHECK_PAYMENTS_CRON", "0 9 * * *")
+REMINDER_HOUR = int(os.getenv("REMINDER_HOUR", 10))
+# Сколько дней хранить отправленные сообщения рассылок в broadcast_messages
+BROADCAST_RETENTION_DAYS = int(os.getenv("BROADCAST_RETENTION_DAYS", 7))
+VOCABULARY_CRON = os.getenv("VOCABULARY_CRON", "0 8 * * *")
+# Окно доставки ежедневных слов, минуты: что не успели отправить — не отправляется
+VOCABULARY_WINDOW = int(os.getenv("VOCABULARY_WINDOW", 180))
+
+# PostgreSQL база данных через Supabase (пул соединений asyncpg)
+db = Database(
+    os.getenv("DATABASE_URL"),
+    min_size=int(os.getenv("DB_POOL_MIN", 1)),
+    max_size=int(os.getenv("DB_POOL_MAX", 10)),
+    user_cache_size=int(os.getenv("USER_CACHE_SIZE", 1024)),
+    user_cache_ttl=int(os.getenv("USER_CACHE_TTL", 10 if MULTI_WORKER else 60)),
+    stats_cache_ttl=int(os.getenv("STATS_CACHE_TTL", 60)),
+)
+# Время каждого метода Database попадает в /metrics
+instrument_database(db)
+
+# Хранилище состояний FSM: postgres (по умолчанию, переживает перезапуск) или memory
+if os.getenv("FSM_STORAGE", "postgres") == "memory":
+    storage = MemoryStorage()
+else:
+    storage = PostgresStorage(
+        db,
+        state_ttl=int(os.getenv("FSM_STATE_TTL", 24 * 60 * 60)),
+        flush_interval=float(os.getenv("FSM_FLUSH_INTERVAL", 1.0)),
+        # Несколько воркеров: читаем состояние из базы, иначе другой процесс увидит устаревшее
+        cache_ttl=0 if MULTI_WORKER else 30,
+    )
 
 # Инициализация бота
-bot = Bot(token=TOKEN)
-dp = Dispatcher(bot, storage=MemoryStorage())
-
-# PostgreSQL база данных через Supabase
-class Database:
-    def __init__(self):
-        try:
-            self.conn = psycopg2.connect(os.getenv("DATABASE_URL"))
-            self.cursor = self.conn.cursor()
-            logger.info("Подключение к базе данных PostgreSQL успешно")
-            self._create_tables()
-            self._initialize_promo_codes()
-        except Exception as e:
-            logger.error(f"Ошибка подключения к базе данных: {e}")
-            raise
-
-    def _create_tables(self):
-        try:
-            # Создаём таблицу users, если она ещё не существует
-            self.cursor.execute('''CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                user_id BIGINT UNIQUE,
-                source TEXT,
-                email TEXT UNIQUE,
-                telegram TEXT,
-                books TEXT,
-                trial_end TEXT,
-                payment_due TEXT,
-                paid_months INTEGER DEFAULT 0,
-                payment_confirmed INTEGER DEFAULT 0,
-                promo_code TEXT
-            )''')
-            # Добавляем столбец is_active, если он отсутствует
-            self.cursor.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS is_active INTEGER DEFAULT 1")
-
-            # Создаём таблицу promo_codes
-            self.cursor.execute('''CREATE TABLE IF NOT EXISTS promo_codes (
-                code TEXT PRIMARY KEY,
-                teacher_name TEXT,
-                used_count INTEGER DEFAULT 0,
-                bonus_days INTEGER DEFAULT 7
-            )''')
-
-            # Создаём таблицу messages
-            self.cursor.execute('''CREATE TABLE IF NOT EXISTS messages (
-                id SERIAL PRIMARY KEY,
-                user_id BIGINT,
-                message_text TEXT,
-                is_from_user INTEGER DEFAULT 1,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )''')
-            self.conn.commit()
-            logger.info("Таблицы созданы или уже существуют")
-        except Exception as e:
-            logger.error(f"Ошибка при создании таблиц: {e}")
-            self.conn.rollback()
-            raise
-            # main.py (часть 2)
-    def _initialize_promo_codes(self):
-        try:
-            promo_codes = [
-                "Teacher01", "Teacher02", "Teacher03", "Teacher04", "Teacher05",
-                "Teacher06", "Teacher07", "Teacher08", "Teacher09", "Teacher10",
-                "Teacher11", "Teacher12", "Teacher13", "Teacher14", "Teacher15"
-            ]
-            for code in promo_codes:
-                self.cursor.execute(
-                    "INSERT INTO promo_codes (code, teacher_name, used_count, bonus_days) VALUES (%s, %s, 0, 7) ON CONFLICT (code) DO NOTHING",
-                    (code, code)
-                )
-            self.conn.commit()
-            logger.info("Промокоды инициализированы")
-        except Exception as e:
-            logger.error(f"Ошибка при инициализации промокодов: {e}")
-            self.conn.rollback()
-
-    def add_user(self, user_id, source, email, telegram, books, promo_code=None):
-        try:
-            trial_end = (datetime.now() + timedelta(days=3)).strftime('%Y-%m-%d')
-            if promo_code:
-                promo = self.get_promo_code(promo_code)
-                if promo:
-                    bonus_days = promo[3]
-                    trial_end = (datetime.now() + timedelta(days=3 + bonus_days)).strftime('%Y-%m-%d')
-                    self.cursor.execute("UPDATE promo_codes SET used_count = used_count + 1 WHERE code = %s", (promo_code,))
-            self.cursor.execute(
-                "INSERT INTO users (user_id, source, email, telegram, books, trial_end, payment_due, promo_code, is_active) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 1) ON CONFLICT (user_id) DO NOTHING",
-                (user_id, source, email, telegram, books, trial_end, trial_end, promo_code)
-            )
-            self.conn.commit()
-            logger.info(f"Добавлен пользователь: user_id={user_id}, source={source}, email={email}, promo_code={promo_code}")
-        except Exception as e:
-            logger.error(f"Ошибка при добавлении пользователя: {e}")
-            self.conn.rollback()
-
-    def get_user(self, user_id):
-        try:
-            self.cursor.execute("SELECT * FROM users WHERE user_id = %s", (user_id,))
-            result = self.cursor.fetchone()
-            logger.info(f"Поиск пользователя: user_id={user_id}, результат={result}")
-            return result
-        except Exception as e:
-            logger.error(f"Ошибка при получении пользователя: {e}")
-            return None
-
-    def update_payment(self, user_id, months, bonus=0):
-        try:
-            total = months + bonus
-            self.cursor.execute(
-                "UPDATE users SET paid_months = paid_months + %s, payment_confirmed = 1, payment_due = %s, is_active = 1 WHERE user_id = %s",
-                (total, (datetime.now() + timedelta(days=30 * total)).strftime('%Y-%m-%d'), user_id)
-            )
-            self.conn.commit()
-            logger.info(f"Обновлена оплата: user_id={user_id}, months={months}, bonus={bonus}")
-        except Exception as e:
-            logger.error(f"Ошибка при обновлении оплаты: {e}")
-            self.conn.rollback()
-
-    def deactivate_user(self, user_id):
-        try:
-            self.cursor.execute("UPDATE users SET is_active = 0 WHERE user_id = %s", (user_id,))
-            self.conn.commit()
-            logger.info(f"Пользователь деактивирован: user_id={user_id}")
-        except Exception as e:
-            logger.error(f"Ошибка при деактивации пользователя: {e}")
-            self.conn.rollback()
-
-    def reset_books(self, user_id):
-        try:
-            self.cursor.execute("UPDATE users SET books = NULL WHERE user_id = %s", (user_id,))
-            self.conn.commit()
-            logger.info(f"Книги сброшены для user_id={user_id}")
-        except Exception as e:
-            logger.error(f"Ошибка при сбросе книг: {e}")
-            self.conn.rollback()
-
-    def get_promo_code(self, code):
-        try:
-            self.cursor.execute("SELECT code, teacher_name, used_count, bonus_days FROM promo_codes WHERE code = %s", (code,))
-            return self.cursor.fetchone()
-        except Exception as e:
-            logger.error(f"Ошибка при получении промокода: {e}")
-            return None
-
-    def get_promo_stats(self):
-        try:
-            self.cursor.execute("SELECT code, teacher_name, used_count, bonus_days FROM promo_codes")
-            return self.cursor.fetchall()
-        except Exception as e:
-            logger.error(f"Ошибка при получении статистики промокодов: {e}")
-            return []
-
-    def get_unpaid_users(self, date):
-        try:
-            self.cursor.execute("SELECT user_id, email, telegram FROM users WHERE payment_due = %s AND payment_confirmed = 0 AND is_active = 1", (date,))
-            return self.cursor.fetchall()
-        except Exception as e:
-            logger.error(f"Ошибка при получении пользователей без оплаты: {e}")
-            return []
-
-    def get_users_near_trial_end(self, date):
-        try:
-            self.cursor.execute("SELECT user_id, email, telegram FROM users WHERE trial_end = %s AND payment_confirmed = 0 AND is_active = 1", (date,))
-            return self.cursor.fetchall()
-        except Exception as e:
-            logger.error(f"Ошибка при получении пользователей с истекающим пробным периодом: {e}")
-            return []
-
-    def get_all_users(self):
-        try:
-            self.cursor.execute("SELECT user_id, source, email, telegram, books, trial_end, payment_due, paid_months, payment_confirmed, promo_code, is_active FROM users")
-            return self.cursor.fetchall()
-        except Exception as e:
-            logger.error(f"Ошибка при получении всех пользователей: {e}")
-            return []
-
-    def get_stats(self):
-        try:
-            self.cursor.execute("SELECT COUNT(*) FROM users")
-            total_users = self.cursor.fetchone()[0]
-            self.cursor.execute("SELECT COUNT(*) FROM users WHERE payment_confirmed = 1")
-            paid_users = self.cursor.fetchone()[0]
-            self.cursor.execute("SELECT COUNT(*) FROM users WHERE promo_code IS NOT NULL")
-            promo_users = self.cursor.fetchone()[0]
-            return total_users, paid_users, promo_users
-        except Exception as e:
-            logger.error(f"Ошибка при получении статистики: {e}")
-            return 0, 0, 0
-
-    def add_message(self, user_id, message_text, is_from_user=True):
-        try:
-            self.cursor.execute(
-                "INSERT INTO messages (user_id, message_text, is_from_user) VALUES (%s, %s, %s)",
-                (user_id, message_text, 1 if is_from_user else 0)
-            )
-            self.conn.commit()
-            logger.info(f"Сообщение добавлено: user_id={user_id}, from_user={is_from_user}")
-        except Exception as e:
-            logger.error(f"Ошибка при добавлении сообщения: {e}")
-            self.conn.rollback()
-
-    def get_user_messages(self, user_id):
-        try:
-            self.cursor.execute("SELECT message_text, is_from_user, timestamp FROM messages WHERE user_id = %s ORDER BY timestamp", (user_id,))
-            return self.cursor.fetchall()
-        except Exception as e:
-            logger.error(f"Ошибка при получении сообщений пользователя: {e}")
-            return []
-
-db = Database()
+# TELEGRAM_API_URL — другой сервер Bot API (локальный telegram-bot-api или заглушка для нагрузочных тестов).
+# FAKE_TELEGRAM — встроенная замена Bot API (fake_telegram.py) на этом же сервере по пути /fake-telegram,
+# например FAKE_TELEGRAM="latency=0.05,rate_limit=0.01,blocked=0.02"; к Telegram бот не обращается.
+fake_telegram = FakeTelegram.from_config(os.getenv("FAKE_TELEGRAM")) if os.getenv("FAKE_TELEGRAM") else None
+if fake_telegram is not None:
+    TELEGRAM_API_URL = f"http://127.0.0.1:{os.getenv('PORT', 8080)}/fake-telegram"
+else:
+    TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+if TELEGRAM_API_URL:
+    bot = InstrumentedBot(token=TOKEN, server=TelegramAPIServer.from_base(TELEGRAM_API_URL))
+else:
+    bot = InstrumentedBot(token=TOKEN)
+dp = Dispatcher(bot, storage=storage)
+# Задержка обработчиков для /metrics; в лог попадает только выборка LOG_SAMPLE_RATE обновлений
+dp.middleware.setup(HandlerMetricsMiddleware(sample_rate=float(os.getenv("LOG_SAMPLE_RATE", 0.01))))
+if os.getenv("UPDATE_DEDUP", "1" if MULTI_WORKER else "0") == "1":
+    dp.middleware.setup(UpdateDeduplicationMiddleware(db))
+if MULTI_WORKER and isinstance(storage, PostgresStorage):
+    dp.middleware.setup(StorageFlushMiddleware(storage))
+# Частота обновлений от одного пользователя и число одновременно обрабатываемых обновлений;
+# сверх лимита — короткий ответ без обращения к базе (THROTTLE_RATE=0 / MAX_IN_FLIGHT=0 — без ограничения)
+throttling = ThrottlingMiddleware(
+    rate=float(os.getenv("THROTTLE_RATE", 1)),
+    burst=int(os.getenv("THROTTLE_BURST", 10)),
+    max_in_flight=int(os.getenv("MAX_IN_FLIGHT", 100)),
+    exempt=ADMIN_IDS,
+)
+dp.middleware.setup(throttling)
+# Нажатия на кнопки: один обработчик и таблица префикс -> обработчик (callbacks.py)
+callbacks = CallbackRouter(dp, stale_text="⌛ Бу тугма эскирган. Менюдан қайта уриниб кўринг.")
+
+# Фоновые задачи (планировщик, установка webhook) выполняет только процесс-лидер
+leader_lock = LeaderLock(os.getenv("DATABASE_URL"))
+leader_tasks = []
+
+# Планировщик задач лидера; состояние запусков хранится в таблице scheduled_jobs
+scheduler = Scheduler(db, timezone=SCHEDULER_TZ)
+
+# Рассылка уведомлений с учётом лимитов Telegram
+broadcaster = Broadcaster(
+    bot, db,
+    concurrency=int(os.getenv("BROADCAST_CONCURRENCY", 10)),
+    global_rate=float(os.getenv("BROADCAST_RATE", 25)),
+)
+
+# Очередь исходящих сообщений: обработчики не ждут ответа Telegram
+outbound = OutboundQueue(
+    bot, db,
+    workers=int(os.getenv("OUTBOUND_WORKERS", 4)),
+    maxsize=int(os.getenv("OUTBOUND_QUEUE_SIZE", 1000)),
+    rate=float(os.getenv("OUTBOUND_RATE", 25)),
+)
+
+async def collect_outbound_metrics():
+    OUTBOUND_DEPTH.set(value=outbound.depth())
+
+REGISTRY.add_collector(collect_outbound_metrics)
+
+async def collect_throttling_metrics():
+    UPDATES_IN_FLIGHT.set(value=throttling.in_flight)
+
+REGISTRY.add_collector(collect_throttling_metrics)
+if isinstance(storage, PostgresStorage):
+    REGISTRY.add_collector(fsm_states_collector(storage))
+
+# Промокоды в памяти: проверка кода в анкете без запроса к базе
+promo_index = PromoIndex(db, os.getenv("DATABASE_URL"))
+
+# Переписка с админом пишется в messages пакетами; при недоступной базе — в spool-файлы
+message_log = MessageLog(
+    db,
+    flush_size=int(os.getenv("MESSAGE_LOG_FLUSH_SIZE", 200)),
+    flush_interval=float(os.getenv("MESSAGE_LOG_FLUSH_INTERVAL", 2.0)),
+    spool_dir=os.getenv("MESSAGE_SPOOL_DIR", "message_spool"),
+)
+# Месячные разделы messages: старше MESSAGE_RETENTION_MONTHS выгружаются в архив (0 — хранить всё).
+# Без явно заданного MESSAGE_ARCHIVE_DIR переписка не удаляется: локальный диск на Render
+# не переживает перезапуск, и архив там пропал бы вместе с разделами
+MESSAGE_ARCHIVE_DIR = os.getenv("MESSAGE_ARCHIVE_DIR")
+message_archive = MessageArchive(
+    db,
+    archive_dir=MESSAGE_ARCHIVE_DIR,
+    retention_months=int(os.getenv("MESSAGE_RETENTION_MONTHS", 12 if MESSAGE_ARCHIVE_DIR else 0)),
+)
+
+# file_id статических картинок: логотип загружается в Telegram один раз
+media = MediaRegistry(bot, db)
+
+# Сводка уведомлений для админов (кроме чеков на подтверждение — они уходят сразу)
+admin_digest = AdminDigest(
+    bot, ADMIN_IDS,
+    interval=int(os.getenv("ADMIN_DIGEST_INTERVAL", 60)),
+    max_items=int(os.getenv("ADMIN_DIGEST_MAX_ITEMS", 20)),
+)
 
 # Функция для предотвращения распознавания email как ссылки
 def obfuscate_email(email):
@@ -279,6 +227,14 @@ BOOKS = [
     "English vocabulary in use upper-intermediate (rus)", "English vocabulary in use advanced (rus)"
 ]
 
+# Ежедневные слова из выбранных книг; словари — файлы VOCABULARY_DIR/<книга>.tsv
+vocabulary = VocabularyIndex(
+    BOOKS,
+    directory=os.getenv("VOCABULARY_DIR", "vocabulary"),
+    words_per_book=int(os.getenv("VOCABULARY_WORDS_PER_BOOK", 5)),
+)
+vocabulary_delivery = VocabularyDelivery(db, broadcaster, vocabulary, page_size=int(os.getenv("VOCABULARY_PAGE_SIZE", 1000)))
+
 # Клавиатуры
 def get_main_menu():
     return ReplyKeyboardMarkup(resize_keyboard=True).add(
@@ -287,37 +243,111 @@ def get_main_menu():
     )
 
 def get_start_button():
-    return InlineKeyboardMarkup().add(InlineKeyboardButton("\u25B6\uFE0F Рўйхатдан ўтиш", callback_data="start_registration"))
+    return InlineKeyboardMarkup().add(InlineKeyboardButton("\u25B6\uFE0F Рўйхатдан ўтиш", callback_data=START_REGISTRATION.new()))
 
 def get_source_keyboard():
     return InlineKeyboardMarkup(row_width=2).add(
-        InlineKeyboardButton("Instagram", callback_data="source_instagram"),
-        InlineKeyboardButton("Ўқитувчидан", callback_data="source_teacher")
+        InlineKeyboardButton("Instagram", callback_data=SOURCE.new(source="instagram")),
+        InlineKeyboardButton("Ўқитувчидан", callback_data=SOURCE.new(source="teacher"))
     )
 
 def get_payment_options(user_id, promo_code=None):
     price = "49.900 сўм" if promo_code else "59.900 сўм"
     return InlineKeyboardMarkup(row_width=1).add(
-        InlineKeyboardButton(f"📅 1 ой — {price}", callback_data=f"pay_1_{user_id}")
+        InlineKeyboardButton(f"📅 1 ой — {price}", callback_data=PAY.new(months=1, user_id=user_id))
     )
 
 def get_confirmation_buttons(user_id):
     return InlineKeyboardMarkup(row_width=2).add(
-        InlineKeyboardButton("✅ Тасдиқлаш", callback_data=f"payment_approve_{user_id}_0"),
-        InlineKeyboardButton("✅ Тасдиқлаш (+1 ой бонус)", callback_data=f"payment_approve_{user_id}_1"),
-        InlineKeyboardButton("❌ Рад этиш", callback_data=f"payment_reject_{user_id}")
+        InlineKeyboardButton("✅ Тасдиқлаш", callback_data=PAYMENT_APPROVE.new(user_id=user_id, bonus=0)),
+        InlineKeyboardButton("✅ Тасдиқлаш (+1 ой бонус)", callback_data=PAYMENT_APPROVE.new(user_id=user_id, bonus=1)),
+        InlineKeyboardButton("❌ Рад этиш", callback_data=PAYMENT_REJECT.new(user_id=user_id))
     )
 
-def get_profile_buttons(email):
+def get_profile_buttons():
     return InlineKeyboardMarkup(row_width=1).add(
-        InlineKeyboardButton("💳 Обунани узайтириш", callback_data=f"extend_subscription_{email}"),
-        InlineKeyboardButton("🔙 Орқага", callback_data="back_to_menu")
+        InlineKeyboardButton("💳 Обунани узайтириш", callback_data=EXTEND_SUBSCRIPTION.new()),
+        InlineKeyboardButton("🔙 Орқага", callback_data=BACK_TO_MENU.new())
     )
 
 def get_reset_books_button(user_id):
     return InlineKeyboardMarkup().add(
-        InlineKeyboardButton("📚 Янги китоблар танлаш", callback_data=f"reset_books_{user_id}")
+        InlineKeyboardButton("📚 Янги китоблар танлаш", callback_data=RESET_BOOKS.new(user_id=user_id))
     )
+
+def get_users_page_buttons(rows, has_prev, has_next, encoded_filters):
+    buttons = []
+    if rows and has_prev:
+        buttons.append(InlineKeyboardButton("⬅️ Олдинги", callback_data=USERS_PAGE.new(direction="p", cursor=rows[0][0], filters=encoded_filters)))
+    if rows and has_next:
+        buttons.append(InlineKeyboardButton("Кейинги ➡️", callback_data=USERS_PAGE.new(direction="n", cursor=rows[-1][0], filters=encoded_filters)))
+    return InlineKeyboardMarkup(row_width=2).add(*buttons) if buttons else None
+
+# Фильтры /users: active, inactive, unpaid, promo=КОД, source=instagram|teacher, from=ГГГГ-ММ-ДД, to=ГГГГ-ММ-ДД.
+# В callback_data они кодируются компактно, чтобы уложиться в 64 байта.
+SOURCES = {"instagram": "Instagram", "teacher": "Ўқитувчидан"}
+USER_FILTER_FLAGS = {"active": "a", "inactive": "i", "unpaid": "u"}
+USER_FILTERS_HELP = (
+    "❌ Нотўғри филтр. Мисол:\n"
+    "/users active unpaid promo=Teacher01 source=teacher from=2025-01-01 to=2025-01-31\n"
+    "/export_users jsonl active"
+)
+
+def parse_user_filters(args):
+    filters = {}
+    for arg in args.split():
+        key, _, value = arg.partition("=")
+        key = key.lower()
+        if key in USER_FILTER_FLAGS and not value:
+            filters[key] = True
+        elif key == "promo" and value.isalnum() and len(value) <= 12:
+            filters["promo"] = value
+        elif key == "source" and value.lower() in SOURCES:
+            filters["source"] = SOURCES[value.lower()]
+        elif key in ("from", "to"):
+            filters["date_from" if key == "from" else "date_to"] = datetime.strptime(value, "%Y-%m-%d").date()
+        else:
+            raise ValueError(f"Неизвестный фильтр: {arg}")
+    return filters
+
+def encode_user_filters(filters):
+    tokens = [flag for key, flag in USER_FILTER_FLAGS.items() if filters.get(key)]
+    if filters.get("promo"):
+        tokens.append("p" + filters["promo"])
+    if filters.get("source"):
+        tokens.append("s" + next(key for key, value in SOURCES.items() if value == filters["source"])[0])
+    if filters.get("date_from"):
+        tokens.append("f" + filters["date_from"].strftime("%Y%m%d"))
+    if filters.get("date_to"):
+        tokens.append("t" + filters["date_to"].strftime("%Y%m%d"))
+    return ",".join(tokens)
+
+def decode_user_filters(encoded):
+    flags = {flag: key for key, flag in USER_FILTER_FLAGS.items()}
+    filters = {}
+    for token in filter(None, encoded.split(",")):
+        kind, value = token[0], token[1:]
+        if kind in flags:
+            filters[flags[kind]] = True
+        elif kind == "p":
+            filters["promo"] = value
+        elif kind == "s":
+            filters["source"] = next(name for key, name in SOURCES.items() if key[0] == value)
+        elif kind in ("f", "t"):
+            filters["date_from" if kind == "f" else "date_to"] = datetime.strptime(value, "%Y%m%d").date()
+    return filters
+
+def describe_user_filters(filters):
+    parts = [key for key in USER_FILTER_FLAGS if filters.get(key)]
+    if filters.get("promo"):
+        parts.append(f"promo={filters['promo']}")
+    if filters.get("source"):
+        parts.append(f"source={filters['source']}")
+    if filters.get("date_from"):
+        parts.append(f"from={filters['date_from']}")
+    if filters.get("date_to"):
+        parts.append(f"to={filters['date_to']}")
+    return " ".join(parts)
     # main.py (часть 3)
 # Состояния
 class UserState(StatesGroup):
@@ -335,27 +365,26 @@ class UserState(StatesGroup):
 @dp.message_handler(commands=["start"])
 async def start(message: types.Message):
     try:
-        with open("wordzen_logo.jpg", "rb") as photo:
-            await bot.send_photo(
-                message.chat.id,
-                photo=photo,
-                caption=(
-                    "\U0001F4DA *Wordzen'га хуш келибсиз!*\n\n"
-                    "Бу ерда сиз танланган китобларга эга бўласиз.\n\n"
-                    "\U0001F381 *Янги фойдаланувчилар учун 3 кунлик бепул муддат!*\n\n"
-                    "Рўйхатдан ўтиш учун қуйидаги тугмани босинг \U0001F447"
-                ),
-                parse_mode="Markdown",
-                reply_markup=get_start_button()
-            )
+        await media.send_photo(
+            message.chat.id,
+            "wordzen_logo.jpg",
+            caption=(
+                "\U0001F4DA *Wordzen'га хуш келибсиз!*\n\n"
+                "Бу ерда сиз танланган китобларга эга бўласиз.\n\n"
+                "\U0001F381 *Янги фойдаланувчилар учун 3 кунлик бепул муддат!*\n\n"
+                "Рўйхатдан ўтиш учун қуйидаги тугмани босинг \U0001F447"
+            ),
+            parse_mode="Markdown",
+            reply_markup=get_start_button()
+        )
     except Exception as e:
         logger.error(f"Ошибка в /start: {e}")
         await message.answer("❌ Хатолик юз берди. Кейинроқ уриниб кўринг.")
 
-@dp.callback_query_handler(lambda c: c.data == "start_registration")
+@callbacks.route(START_REGISTRATION)
 async def start_registration(callback_query: types.CallbackQuery):
     try:
-        user = db.get_user(callback_query.from_user.id)
+        user = await db.get_user(callback_query.from_user.id)
         if user and user[11] == 1:  # is_active
             await callback_query.message.delete()
             await callback_query.message.answer("Сиз аллақачон рўйхатдан ўтгансиз. Профилингизни кўриш учун 'Профилим' тугмасини босинг.", reply_markup=get_main_menu())
@@ -377,10 +406,10 @@ async def start_registration(callback_query: types.CallbackQuery):
         logger.error(f"Ошибка в start_registration: {e}")
         await callback_query.message.answer("❌ Хатолик юз берди. Кейинроқ уриниб кўринг.")
 
-@dp.callback_query_handler(lambda c: c.data.startswith("source_"), state=UserState.source)
-async def get_source(callback_query: types.CallbackQuery, state: FSMContext):
+@callbacks.route(SOURCE, state=UserState.source)
+async def get_source(callback_query: types.CallbackQuery, source: str, state: FSMContext):
     try:
-        source = "Instagram" if callback_query.data == "source_instagram" else "Ўқитувчидан"
+        source = SOURCES.get(source, "Ўқитувчидан")
         await state.update_data(source=source)
         if source == "Ўқитувчидан":
             await callback_query.message.edit_text("Сизда промокод борми? Уни киритинг ёки 'йўқ' деб ёзинг:")
@@ -396,12 +425,13 @@ async def get_source(callback_query: types.CallbackQuery, state: FSMContext):
 @dp.message_handler(state=UserState.promo)
 async def get_promo(message: types.Message, state: FSMContext):
     try:
-        promo_code = message.text.strip().upper() if message.text.lower() != 'йўқ' else None
-        if promo_code:
-            promo = db.get_promo_code(promo_code)
+        promo_code = None
+        if message.text.strip().lower() != 'йўқ':
+            promo = promo_index.lookup(message.text)
             if not promo:
                 await message.answer("❌ Промокод топилмади. Яна уриниб кўринг ёки 'йўқ' деб ёзинг:")
                 return
+            promo_code = promo["code"]
         await state.update_data(promo_code=promo_code)
         await message.answer("\U0001F4E7 Email манзилингизни киритинг:")
         await UserState.email.set()
@@ -452,9 +482,9 @@ async def choose_books(message: types.Message, state: FSMContext):
             return
         books = ", ".join(BOOKS[i] for i in book_indices)
 
-        db.add_user(user_id, source, email, telegram, books, promo_code)
-        user = db.get_user(user_id)
+        user = await db.add_user(user_id, source, email, telegram, books, promo_code, today=scheduler.now().date()) or await db.get_user(user_id)
         trial_end = user[6]  # trial_end из базы
+        promo_code = user[10]  # промокод мог закончиться, пока пользователь заполнял анкету
 
         # Уведомление пользователю
         price = "49.900 сўм" if promo_code else "59.900 сўм"
@@ -481,8 +511,7 @@ async def choose_books(message: types.Message, state: FSMContext):
             f"⏳ Синов муддати: {trial_end}\n"
             f"🎟️ Промокод: {promo_code if promo_code else 'қўлланилмаган'}"
         )
-        for admin_id in ADMIN_IDS:
-            await bot.send_message(admin_id, admin_text)
+        admin_digest.add(admin_text)
 
         await state.finish()
     except ValueError:
@@ -491,15 +520,12 @@ async def choose_books(message: types.Message, state: FSMContext):
         logger.error(f"Ошибка в choose_books: {e}")
         await message.answer("❌ Хатолик юз берди. Кейинроқ уриниб кўринг.")
 
-@dp.callback_query_handler(lambda c: c.data.startswith("pay_"))
-async def start_payment(callback_query: types.CallbackQuery, state: FSMContext):
+@callbacks.route(PAY)
+async def start_payment(callback_query: types.CallbackQuery, months: int, user_id: int, state: FSMContext):
     try:
-        parts = callback_query.data.split("_")
-        months = int(parts[1])
-        user_id = int(parts[2])
-        user = db.get_user(user_id)
+        user = await db.get_user(user_id)
         if user:
-            logger.info(f"Начало оплаты: user_id={user_id}, months={months}")
+            logger.info("Начало оплаты: user_id=%s, months=%s", user_id, months)
             await state.update_data(user_id=user_id, months=months, email=user[3])
             price = "49.900 сўм" if user[10] else "59.900 сўм"
             await callback_query.message.answer(
@@ -509,7 +535,7 @@ async def start_payment(callback_query: types.CallbackQuery, state: FSMContext):
                 parse_mode="Markdown"
             )
             await UserState.payment.set()
-            logger.info(f"Состояние установлено: UserState.payment для user_id={user_id}")
+            logger.debug("Состояние установлено: UserState.payment для user_id=%s", user_id)
         else:
             await callback_query.message.answer("❗ Сизнинг аккаунтингиз топилмади.")
     except Exception as e:
@@ -529,7 +555,7 @@ async def receive_payment(message: types.Message, state: FSMContext):
             await state.finish()
             return
 
-        user = db.get_user(user_id)
+        user = await db.get_user(user_id)
         promo_code = user[10] if user else None
         telegram = f"https://t.me/{message.from_user.username}" if message.from_user.username else message.from_user.full_name
         price = "49.900 сўм" if promo_code else "59.900 сўм"
@@ -544,31 +570,23 @@ async def receive_payment(message: types.Message, state: FSMContext):
 
         for admin_id in ADMIN_IDS:
             if message.photo:
-                await bot.send_photo(admin_id, message.photo[-1].file_id, caption=caption, reply_markup=get_confirmation_buttons(user_id))
+                await outbound.send("send_photo", admin_id, message.photo[-1].file_id, caption=caption, reply_markup=get_confirmation_buttons(user_id))
             elif message.document:
-                await bot.send_document(admin_id, message.document.file_id, caption=caption, reply_markup=get_confirmation_buttons(user_id))
+                await outbound.send("send_document", admin_id, message.document.file_id, caption=caption, reply_markup=get_confirmation_buttons(user_id))
             else:
-                await bot.send_message(admin_id, caption + f"\n\n📄 Матн:\n{message.text}", reply_markup=get_confirmation_buttons(user_id))
+                await outbound.send_message(admin_id, caption + f"\n\n📄 Матн:\n{message.text}", reply_markup=get_confirmation_buttons(user_id))
         await message.reply("🧾 Раҳмат! Биз маълумотларни администраторга юбордик. ⏳ Жавобни кутинг.")
-        logger.info(f"Чек отправлен админу: user_id={user_id}, months={months}")
+        logger.info("Чек отправлен админу: user_id=%s, months=%s", user_id, months)
         await state.finish()
     except Exception as e:
         logger.error(f"Ошибка при отправке чека админу: {e}")
         await message.reply("❌ Чекни юборишда хатолик. Яна уриниб кўринг.")
 
-@dp.callback_query_handler(lambda c: c.data.startswith("payment_approve_"))
-async def confirm_payment(callback_query: types.CallbackQuery):
+@callbacks.route(PAYMENT_APPROVE)
+async def confirm_payment(callback_query: types.CallbackQuery, user_id: int, bonus: int):
     try:
-        logger.info(f"Получен callback: {callback_query.data}")
-        parts = callback_query.data.split("_")
-        if len(parts) != 4:
-            logger.error(f"Неверный формат callback_data: {callback_query.data}")
-            await callback_query.answer("❌ Хатолик: нотўғри сўров.")
-            return
-
-        user_id = int(parts[2])
-        bonus = int(parts[3])
-        user = db.get_user(user_id)
+        logger.debug("Получен callback: %s", callback_query.data)
+        user = await db.get_user(user_id)
         if not user:
             logger.error(f"Пользователь с user_id={user_id} не найден")
             await callback_query.answer("❌ Фойдаланувчи топилмади.")
@@ -577,7 +595,7 @@ async def confirm_payment(callback_query: types.CallbackQuery):
         email = user[3]
         promo_code = user[10]
         months = 1  # Только 1 месяц
-        db.update_payment(user_id, months, bonus)
+        await db.update_payment(user_id, months, bonus, today=scheduler.now().date())
 
         if callback_query.message.text:
             await callback_query.message.edit_text(
@@ -585,32 +603,31 @@ async def confirm_payment(callback_query: types.CallbackQuery):
                 f"🎟️ Промокод: {promo_code if promo_code else 'қўлланилмаган'}"
             )
         else:
-            await bot.send_message(
+            await outbound.send_message(
                 callback_query.message.chat.id,
                 f"✅ {obfuscate_email(email)} учун тўлов тасдиқланди. Қўшилди: {months} ой + {bonus} ой бонус\n"
                 f"🎟️ Промокод: {promo_code if promo_code else 'қўлланилмаган'}"
             )
             await callback_query.message.delete()
 
-        await bot.send_message(
+        await outbound.send_message(
             user_id,
             "✅ Хуш келибсиз! Профилингизга ўтиш учун қуйидаги тугмани босинг.",
             reply_markup=get_main_menu()
         )
-        await bot.send_message(user_id, f"🎉 Табриклаймиз! Сиз {months} ойга обуна харид қилдингиз ва {bonus} ой бонус оласиз!")
-        logger.info(f"Оплата подтверждена: user_id={user_id}, months={months}, bonus={bonus}")
+        await outbound.send_message(user_id, f"🎉 Табриклаймиз! Сиз {months} ойга обуна харид қилдингиз ва {bonus} ой бонус оласиз!")
+        logger.info("Оплата подтверждена: user_id=%s, months=%s, bonus=%s", user_id, months, bonus)
     except Exception as e:
         logger.error(f"Ошибка в confirm_payment: {e}")
         await callback_query.answer("❌ Хатолик юз берди.")
 
-@dp.callback_query_handler(lambda c: c.data.startswith("payment_reject_"))
-async def reject_payment(callback_query: types.CallbackQuery):
+@callbacks.route(PAYMENT_REJECT)
+async def reject_payment(callback_query: types.CallbackQuery, user_id: int):
     try:
-        logger.info(f"Получен callback: {callback_query.data}")
-        user_id = int(callback_query.data.split("_")[2])
-        await bot.send_message(user_id, "❌ Афсуски, тўлов текширишдан ўтмади. Яна уриниб кўринг ёки қўллаб-қувватлаш хизматига мурожаат қилинг.")
+        logger.debug("Получен callback: %s", callback_query.data)
+        await outbound.send_message(user_id, "❌ Афсуски, тўлов текширишдан ўтмади. Яна уриниб кўринг ёки қўллаб-қувватлаш хизматига мурожаат қилинг.")
         await callback_query.answer("Тўлов рад этилди.")
-        logger.info(f"Оплата отклонена для user_id={user_id}")
+        logger.info("Оплата отклонена для user_id=%s", user_id)
     except Exception as e:
         logger.error(f"Ошибка в reject_payment: {e}")
         await callback_query.answer("❌ Хатолик юз берди.")
@@ -619,8 +636,8 @@ async def reject_payment(callback_query: types.CallbackQuery):
 async def profile_info(message: types.Message):
     try:
         user_id = message.from_user.id
-        logger.info(f"Поиск профиля для user_id: {user_id}")
-        user = db.get_user(user_id)
+        logger.debug("Поиск профиля для user_id: %s", user_id)
+        user = await db.get_user(user_id)
         if user:
             user_id, _, source, email, telegram, books, trial_end, payment_due, paid, confirmed, promo_code, is_active = user
             if is_active == 0:
@@ -633,27 +650,26 @@ async def profile_info(message: types.Message):
                 await message.answer("💳 Тарифни танланг:")
                 return
             text = format_user_info(user_id, source, email, telegram, books, trial_end, payment_due, paid, confirmed, promo_code, is_active) + "\n\nСиз қуйида обунани узайтиришингиз мумкин:"
-            await message.answer(text, reply_markup=get_profile_buttons(email), parse_mode="Markdown")
+            await message.answer(text, reply_markup=get_profile_buttons(), parse_mode="Markdown")
         else:
             await message.answer(
                 "👋 *Сиз ҳали Wordzen'да рўйхатдан ўтмангиз!*\n\n"
                 "Ботдан фойдаланишни бошлаш ва 3 кунлик бепул муддат олиш учун қуйидаги тугмани босинг:",
                 parse_mode="Markdown",
                 reply_markup=InlineKeyboardMarkup().add(
-                    InlineKeyboardButton("\u25B6\uFE0F Рўйхатдан ўтиш", callback_data="start_registration")
+                    InlineKeyboardButton("\u25B6\uFE0F Рўйхатдан ўтиш", callback_data=START_REGISTRATION.new())
                 )
             )
     except Exception as e:
         logger.error(f"Ошибка в profile_info: {e}")
         await message.answer("❌ Хатолик юз берди. Кейинроқ уриниб кўринг.")
 
-@dp.callback_query_handler(lambda c: c.data.startswith("extend_subscription_"))
-async def extend_subscription(callback_query: types.CallbackQuery, state: FSMContext):
+@callbacks.route(EXTEND_SUBSCRIPTION)
+async def extend_subscription(callback_query: types.CallbackQuery):
     try:
-        email = callback_query.data.split("_")[-1]
         user_id = callback_query.from_user.id
-        user = db.get_user(user_id)
-        if user and user[3] == email:
+        user = await db.get_user(user_id)
+        if user:
             await callback_query.message.edit_text("💳 Обунани узайтириш учун тарифни танланг:", reply_markup=get_payment_options(user_id, user[10]))
         else:
             await callback_query.message.edit_text("❗ Сизнинг аккаунтингиз топилмади.")
@@ -661,7 +677,7 @@ async def extend_subscription(callback_query: types.CallbackQuery, state: FSMCon
         logger.error(f"Ошибка в extend_subscription: {e}")
         await callback_query.message.answer("❌ Хатолик юз берди. Кейинроқ уриниб кўринг.")
 
-@dp.callback_query_handler(lambda c: c.data == "back_to_menu")
+@callbacks.route(BACK_TO_MENU)
 async def back_to_menu(callback_query: types.CallbackQuery):
     try:
         await callback_query.message.delete()
@@ -673,7 +689,7 @@ async def back_to_menu(callback_query: types.CallbackQuery):
 async def message_to_admin(message: types.Message, state: FSMContext):
     try:
         user_id = message.from_user.id
-        user = db.get_user(user_id)
+        user = await db.get_user(user_id)
         if not user or user[11] == 0:
             await message.answer("❌ Сиз рўйхатдан ўтмагансингиз ёки аккаунтингиз ўчирилган.")
             return
@@ -689,7 +705,7 @@ async def send_message_to_admin(message: types.Message, state: FSMContext):
     try:
         user_data = await state.get_data()
         user_id = user_data.get("user_id")
-        user = db.get_user(user_id)
+        user = await db.get_user(user_id)
         if not user:
             await message.reply("❌ Фойдаланувчи топилмади.")
             await state.finish()
@@ -697,7 +713,7 @@ async def send_message_to_admin(message: types.Message, state: FSMContext):
 
         email = user[3]
         telegram = user[4]
-        db.add_message(user_id, message.text if message.text else "Медиа хабар")
+        message_log.add(user_id, message.text if message.text else "Медиа хабар")
 
         caption = (
             f"📩 Янги хабар:\n\n"
@@ -706,26 +722,30 @@ async def send_message_to_admin(message: types.Message, state: FSMContext):
             f"👤 Telegram: {telegram}\n"
         )
         reply_button = InlineKeyboardMarkup().add(
-            InlineKeyboardButton("✍️ Жавоб бериш", callback_data=f"reply_to_{user_id}")
+            InlineKeyboardButton("✍️ Жавоб бериш", callback_data=REPLY_TO.new(user_id=user_id))
         )
 
-        for admin_id in ADMIN_IDS:
-            if message.photo:
-                await bot.send_photo(admin_id, message.photo[-1].file_id, caption=caption, reply_markup=reply_button)
-            elif message.document:
-                await bot.send_document(admin_id, message.document.file_id, caption=caption, reply_markup=reply_button)
-            else:
-                await bot.send_message(admin_id, caption + f"📄 Матн:\n{message.text}", reply_markup=reply_button)
+        # Медиа пересылаем сразу, текстовые сообщения попадают в сводку с кнопкой ответа
+        if message.photo or message.document:
+            for admin_id in ADMIN_IDS:
+                if message.photo:
+                    await outbound.send("send_photo", admin_id, message.photo[-1].file_id, caption=caption, reply_markup=reply_button)
+                else:
+                    await outbound.send("send_document", admin_id, message.document.file_id, caption=caption, reply_markup=reply_button)
+        else:
+            admin_digest.add(
+                caption + f"📄 Матн:\n{message.text}",
+                InlineKeyboardButton(f"✍️ {user_id}", callback_data=REPLY_TO.new(user_id=user_id))
+            )
         await message.reply("✅ Хабар админга юборилди. Жавобни кутинг.")
         await state.finish()
     except Exception as e:
         logger.error(f"Ошибка при отправке сообщения админу: {e}")
         await message.reply("❌ Хабарни юборишда хатолик. Яна уриниб кўринг.")
 
-@dp.callback_query_handler(lambda c: c.data.startswith("reply_to_"))
-async def reply_to_user(callback_query: types.CallbackQuery, state: FSMContext):
+@callbacks.route(REPLY_TO)
+async def reply_to_user(callback_query: types.CallbackQuery, user_id: int, state: FSMContext):
     try:
-        user_id = int(callback_query.data.split("_")[2])
         await callback_query.message.answer("Фойдаланувчига жавобингизни юборинг (матн, фото ёки документ):")
         await state.update_data(user_id=user_id)
         await UserState.reply_to_user.set()
@@ -738,49 +758,186 @@ async def send_reply_to_user(message: types.Message, state: FSMContext):
     try:
         user_data = await state.get_data()
         user_id = user_data.get("user_id")
-        db.add_message(user_id, message.text if message.text else "Медиа хабар", is_from_user=False)
+        message_log.add(user_id, message.text if message.text else "Медиа хабар", is_from_user=False)
 
         if message.photo:
-            await bot.send_photo(user_id, message.photo[-1].file_id, caption=message.caption or "Админдан жавоб:")
+            await outbound.send("send_photo", user_id, message.photo[-1].file_id, caption=message.caption or "Админдан жавоб:")
         elif message.document:
-            await bot.send_document(user_id, message.document.file_id, caption=message.caption or "Админдан жавоб:")
+            await outbound.send("send_document", user_id, message.document.file_id, caption=message.caption or "Админдан жавоб:")
         else:
-            await bot.send_message(user_id, f"📩 Админдан жавоб:\n{message.text}")
+            await outbound.send_message(user_id, f"📩 Админдан жавоб:\n{message.text}")
         await message.reply("✅ Жавоб фойдаланувчига юборилди.")
         await state.finish()
     except Exception as e:
         logger.error(f"Ошибка при отправке ответа пользователю {user_id}: {e}")
         await message.reply("❌ Жавобни юборишда хатолик. Яна уриниб кўринг.")
         # main.py (часть 4)
+def format_users_page(rows, filters):
+    text = "👥 Фойдаланувчилар рўйхати:\n"
+    if filters:
+        text += "🔎 Филтр: " + describe_user_filters(filters) + "\n"
+    if not rows:
+        return text + "\nҲеч ким топилмади."
+    for _, user_id, source, email, telegram, books, trial_end, payment_due, paid, confirmed, promo_code, is_active in rows:
+        text += f"\n🆔 {user_id}\n📡 Бизни қаердан топди: {source}\n📧 {obfuscate_email(email)}\n👤 {telegram}\n📚 Китоблар: {books or 'танланмаган'}\n⏳ Синов: {trial_end}\n⏳ Обуна: {payment_due}\n💰 Ойлар: {paid}\n✅ Тўланган: {'Ҳа' if confirmed else 'Йўқ'}\n🎟️ Промокод: {promo_code if promo_code else 'қўлланилмаган'}\n🔄 Актив: {'Фаол' if is_active else 'Ўчирилган'}\n---"
+    return text[:4096]
+
+async def show_users_page(filters, after=None, before=None):
+    rows, has_prev, has_next = await db.list_users_page(filters, after=after, before=before, limit=USERS_PAGE_SIZE)
+    encoded = encode_user_filters(filters)
+    return format_users_page(rows, filters), get_users_page_buttons(rows, has_prev, has_next, encoded)
+
 @dp.message_handler(commands=["users"])
 async def list_users(message: types.Message):
     try:
         if message.from_user.id not in ADMIN_IDS:
             await message.answer("❌ Сизда бу команда учун рухсат йўқ.")
             return
-        users = db.get_all_users()
-        text = "👥 Фойдаланувчилар рўйхати:\n"
-        for user in users:
-            user_id, source, email, telegram, books, trial_end, payment_due, paid, confirmed, promo_code, is_active = user
-            text += f"\n🆔 {user_id}\n📡 Бизни қаердан топди: {source}\n📧 {obfuscate_email(email)}\n👤 {telegram}\n📚 Китоблар: {books or 'танланмаган'}\n⏳ Синов: {trial_end}\n⏳ Обуна: {payment_due}\n💰 Ойлар: {paid}\n✅ Тўланган: {'Ҳа' if confirmed else 'Йўқ'}\n🎟️ Промокод: {promo_code if promo_code else 'қўлланилмаган'}\n🔄 Актив: {'Фаол' if is_active else 'Ўчирилган'}\n---"
-        await message.answer(text)
+        filters = parse_user_filters(message.get_args() or "")
+        text, reply_markup = await show_users_page(filters)
+        await message.answer(text, reply_markup=reply_markup)
+    except ValueError:
+        await message.answer(USER_FILTERS_HELP)
     except Exception as e:
         logger.error(f"Ошибка в list_users: {e}")
         await message.answer("❌ Хатолик юз берди. Кейинроқ уриниб кўринг.")
 
+@callbacks.route(USERS_PAGE)
+async def list_users_page(callback_query: types.CallbackQuery, direction: str, cursor: int, filters: str):
+    try:
+        if callback_query.from_user.id not in ADMIN_IDS:
+            await callback_query.answer("❌ Сизда бу команда учун рухсат йўқ.")
+            return
+        filters = decode_user_filters(filters)
+        if direction == "n":
+            text, reply_markup = await show_users_page(filters, after=cursor)
+        else:
+            text, reply_markup = await show_users_page(filters, before=cursor)
+        await callback_query.message.edit_text(text, reply_markup=reply_markup)
+        await callback_query.answer()
+    except Exception as e:
+        logger.error(f"Ошибка в list_users_page: {e}")
+        await callback_query.answer("❌ Хатолик юз берди.")
+
+@dp.message_handler(commands=["export_users"])
+async def export_users(message: types.Message):
+    path = None
+    try:
+        if message.from_user.id not in ADMIN_IDS:
+            await message.answer("❌ Сизда бу команда учун рухсат йўқ.")
+            return
+        args = (message.get_args() or "").split()
+        fmt = "csv"
+        if args and args[0].lower() in ("csv", "jsonl"):
+            fmt = args.pop(0).lower()
+        filters = parse_user_filters(" ".join(args))
+
+        # Строки пишутся в файл по мере чтения курсора, весь список в память не загружается
+        with tempfile.NamedTemporaryFile("w", suffix=f".{fmt}", encoding="utf-8", newline="", delete=False) as f:
+            path = f.name
+            writer = csv.writer(f) if fmt == "csv" else None
+            header = None
+            count = 0
+            async for row in db.iter_users(filters):
+                if header is None:
+                    header = list(row.keys())
+                    if writer:
+                        writer.writerow(header)
+                if writer:
+                    writer.writerow(list(row.values()))
+                else:
+                    f.write(json.dumps(dict(row), ensure_ascii=False, default=str) + "\n")
+                count += 1
+        filename = f"users_{datetime.now().strftime('%Y%m%d_%H%M')}.{fmt}"
+        await message.answer_document(types.InputFile(path, filename=filename), caption=f"👥 {count} та фойдаланувчи")
+    except ValueError:
+        await message.answer(USER_FILTERS_HELP)
+    except Exception as e:
+        logger.error(f"Ошибка в export_users: {e}")
+        await message.answer("❌ Хатолик юз берди. Кейинроқ уриниб кўринг.")
+    finally:
+        if path:
+            os.remove(path)
+
+# Курсор /history в callback_data: timestamp в микросекундах от эпохи и id сообщения
+HISTORY_EPOCH = datetime(1970, 1, 1)
+HISTORY_TEXT_LIMIT = 300
+
+def history_cursor(row):
+    return {"timestamp": (row["timestamp"] - HISTORY_EPOCH) // timedelta(microseconds=1), "message_id": row["id"]}
+
+def format_history_page(user_id, rows):
+    text = f"💬 Ёзишмалар: {user_id}\n"
+    if not rows:
+        return text + "\nХабарлар йўқ."
+    for row in rows:
+        message_text = row["message_text"] or ""
+        if len(message_text) > HISTORY_TEXT_LIMIT:
+            message_text = message_text[:HISTORY_TEXT_LIMIT] + "…"
+        author = "👤 Фойдаланувчи" if row["is_from_user"] else "🛠 Админ"
+        text += f"\n{author}, {row['timestamp']:%d.%m.%Y %H:%M}:\n{message_text}\n"
+    return text[:4096]
+
+def get_history_page_buttons(user_id, rows, has_older, has_newer):
+    buttons = []
+    if rows and has_older:
+        buttons.append(InlineKeyboardButton("⬅️ Олдинги", callback_data=HISTORY_PAGE.new(direction="o", user_id=user_id, **history_cursor(rows[0]))))
+    if rows and has_newer:
+        buttons.append(InlineKeyboardButton("Кейинги ➡️", callback_data=HISTORY_PAGE.new(direction="n", user_id=user_id, **history_cursor(rows[-1]))))
+    return InlineKeyboardMarkup(row_width=2).add(*buttons) if buttons else None
+
+# Страница переписки: за раз читается не больше HISTORY_PAGE_SIZE сообщений
+async def show_history_page(user_id, before=None, after=None):
+    rows, has_older, has_newer = await db.get_user_messages(user_id, before=before, after=after, limit=HISTORY_PAGE_SIZE)
+    return format_history_page(user_id, rows), get_history_page_buttons(user_id, rows, has_older, has_newer)
+
+@dp.message_handler(commands=["history"])
+async def user_history(message: types.Message):
+    try:
+        if message.from_user.id not in ADMIN_IDS:
+            await message.answer("❌ Сизда бу команда учун рухсат йўқ.")
+            return
+        args = (message.get_args() or "").strip()
+        if not args.isdigit():
+            await message.answer("❌ Фойдаланувчи ID сини кўрсатинг. Мисол:\n/history 123456789")
+            return
+        text, reply_markup = await show_history_page(int(args))
+        await message.answer(text, reply_markup=reply_markup)
+    except Exception as e:
+        logger.error(f"Ошибка в user_history: {e}")
+        await message.answer("❌ Хатолик юз берди. Кейинроқ уриниб кўринг.")
+
+@callbacks.route(HISTORY_PAGE)
+async def user_history_page(callback_query: types.CallbackQuery, direction: str, user_id: int, timestamp: int, message_id: int):
+    try:
+        if callback_query.from_user.id not in ADMIN_IDS:
+            await callback_query.answer("❌ Сизда бу команда учун рухсат йўқ.")
+            return
+        cursor = (HISTORY_EPOCH + timedelta(microseconds=timestamp), message_id)
+        if direction == "n":
+            text, reply_markup = await show_history_page(user_id, after=cursor)
+        else:
+            text, reply_markup = await show_history_page(user_id, before=cursor)
+        await callback_query.message.edit_text(text, reply_markup=reply_markup)
+        await callback_query.answer()
+    except Exception as e:
+        logger.error(f"Ошибка в user_history_page: {e}")
+        await callback_query.answer("❌ Хатолик юз берди.")
+
 @dp.message_handler(commands=["promo_stats"])
 async def promo_stats(message: types.Message):
     try:
         if message.from_user.id not in ADMIN_IDS:
             await message.answer("❌ Сизда бу команда учун рухсат йўқ.")
             return
-        stats = db.get_promo_stats()
+        stats = await db.get_promo_stats()
         if not stats:
             await message.answer("📊 Ҳозирча промокодлар йўқ.")
             return
         text = "📊 Промокодлар статистикаси:\n"
-        for code, teacher_name, used_count, bonus_days in stats:
-            text += f"\nКод: `{code}`\nЎқитувчи: {teacher_name}\nФойдаланилди: {used_count}\nБонус: {bonus_days} кун\n---"
+        for code, teacher_name, used_count, bonus_days, paid in stats:
+            conversion = f" ({paid / used_count:.0%})" if used_count else ""
+            text += f"\nКод: `{code}`\nЎқитувчи: {teacher_name}\nФойдаланилди: {used_count}\nТўлаганлар: {paid}{conversion}\nБонус: {bonus_days} кун\n---"
         await message.answer(text, parse_mode="Markdown")
     except Exception as e:
         logger.error(f"Ошибка в promo_stats: {e}")
@@ -792,12 +949,29 @@ async def show_stats(message: types.Message):
         if message.from_user.id not in ADMIN_IDS:
             await message.answer("❌ Сизда бу команда учун рухсат йўқ.")
             return
-        total_users, paid_users, promo_users = db.get_stats()
+        stats = await db.get_stats()
+        cache_stats = db.user_cache.stats()
         text = (
             "📊 Умумий статистика:\n"
-            f"👥 Жами фойдаланувчилар: {total_users}\n"
-            f"💳 Обуна тўлаганлар: {paid_users}\n"
-            f"🎟️ Промокод ишлатганлар: {promo_users}"
+            f"👥 Жами фойдаланувчилар: {stats['total']}\n"
+            f"🔄 Фаол / ўчирилган: {stats['active']} / {stats['inactive']}\n"
+            f"⏳ Синов/тўланмаган (фаол): {stats['trial']}\n"
+            f"💳 Обуна тўлаганлар: {stats['paid']}\n"
+            f"🎟️ Промокод ишлатганлар: {stats['promo']}\n"
+        )
+        text += "\n📡 Манбалар бўйича (жами / тўлаган):\n"
+        for source, total, paid in stats["by_source"]:
+            text += f"• {source or '—'}: {total} / {paid} ({paid / total:.0%})\n"
+        if stats["by_promo"]:
+            text += "\n🎟️ Промокодлар бўйича (жами / тўлаган):\n"
+            for code, total, paid in stats["by_promo"]:
+                text += f"• {code}: {total} / {paid} ({paid / total:.0%})\n"
+        text += f"\n🗄 Кэш: {cache_stats['size']} ёзув, hit {cache_stats['hits']} / miss {cache_stats['misses']} ({cache_stats['hit_rate']:.0%})"
+        outbound_stats = outbound.stats()
+        text += (
+            f"\n📤 Навбат: {outbound_stats['depth']} кутмоқда, {outbound_stats['sent']} юборилди, "
+            f"{outbound_stats['retried']} қайта уриниш, {outbound_stats['dead']} етказилмади, "
+            f"кечикиш {outbound_stats['latency_avg']:.2f} / p95 {outbound_stats['latency_p95']:.2f} сек."
         )
         await message.answer(text)
     except Exception as e:
@@ -811,28 +985,27 @@ async def reset_books_admin(message: types.Message):
             await message.answer("❌ Сизда бу команда учун рухсат йўқ.")
             return
         user_id = int(message.get_args())
-        user = db.get_user(user_id)
+        user = await db.get_user(user_id)
         if not user:
             await message.answer(f"❌ ID {user_id} билан фойдаланувчи топилмади.")
             return
-        db.reset_books(user_id)
+        await db.reset_books(user_id)
         await message.answer(f"✅ ID {user_id} фойдаланувчиси учун китоблар тозаланди. Энди у янги китоблар танлай олади.")
-        await bot.send_message(user_id, "📚 Сизнинг китобларингиз тозаланди. Янги китоблар танлаш учун /start буйруғини босинг.")
+        await outbound.send_message(user_id, "📚 Сизнинг китобларингиз тозаланди. Янги китоблар танлаш учун /start буйруғини босинг.")
     except ValueError:
         await message.answer("❌ Фойдаланувчи ID'ни киритинг. Масалан: /reset 123456789")
     except Exception as e:
         logger.error(f"Ошибка в reset_books_admin: {e}")
         await message.answer("❌ Хатолик юз берди. Кейинроқ уриниб кўринг.")
 
-@dp.callback_query_handler(lambda c: c.data.startswith("reset_books_"))
-async def reset_books_user(callback_query: types.CallbackQuery, state: FSMContext):
+@callbacks.route(RESET_BOOKS)
+async def reset_books_user(callback_query: types.CallbackQuery, user_id: int, state: FSMContext):
     try:
-        user_id = int(callback_query.data.split("_")[2])
-        user = db.get_user(user_id)
+        user = await db.get_user(user_id)
         if not user:
             await callback_query.message.edit_text("❌ Фойдаланувчи топилмади.")
             return
-        db.reset_books(user_id)
+        await db.reset_books(user_id)
         await callback_query.message.edit_text(
             "📚 Сизнинг китобларингиз тозаланди. Янги китоблар танлаш учун рақамларни юборинг:\n"
             "Рўйхат:\n" + "\n".join(f"{i+1}. {book}" for i, book in enumerate(BOOKS))
@@ -856,14 +1029,13 @@ async def choose_new_books(message: types.Message, state: FSMContext):
             await message.answer("Нотўғри рақамлар. Рўйхатдан 3 та китоб рақамини танланг:")
             return
         books = ", ".join(BOOKS[i] for i in book_indices)
-        user = db.get_user(user_id)
+        user = await db.get_user(user_id)
         if not user:
             await message.answer("❌ Фойдаланувчи топилмади.")
             await state.finish()
             return
-        db.cursor.execute("UPDATE users SET books = %s WHERE user_id = %s", (books, user_id))
-        db.conn.commit()
-        user = db.get_user(user_id)
+        await db.update_books(user_id, books)
+        user = await db.get_user(user_id)
         user_id, _, source, email, telegram, books, trial_end, payment_due, paid, confirmed, promo_code, is_active = user
         text = format_user_info(user_id, source, email, telegram, books, trial_end, payment_due, paid, confirmed, promo_code, is_active)
         await message.answer("✅ Китоблар янгиланди!\n\n" + text, parse_mode="Markdown", reply_markup=get_main_menu())
@@ -874,62 +1046,211 @@ async def choose_new_books(message: types.Message, state: FSMContext):
         logger.error(f"Ошибка в choose_new_books: {e}")
         await message.answer("❌ Хатолик юз берди. Кейинроқ уриниб кўринг.")
 
-# Проверка оплаты и пробного периода
-async def check_payments():
-    while True:
-        try:
-            today = datetime.now().strftime('%Y-%m-%d')
-            unpaid_users = db.get_unpaid_users(today)
-            trial_ending_users = db.get_users_near_trial_end(today)
-
-            for user_id, email, telegram in unpaid_users:
-                db.deactivate_user(user_id)
-                await bot.send_message(
-                    user_id,
-                    "❌ Сизнинг обунангиз муддати тугади. Яна фойдаланиш учун тўлов қилинг ва чекни юборинг.",
-                    reply_markup=get_payment_options(user_id)
-                )
-                for admin_id in ADMIN_IDS:
-                    await bot.send_message(
-                        admin_id,
-                        f"❌ Фойдаланувчи ўчирилди (обуна тугади):\n"
-                        f"🆔 {user_id}\n📧 {obfuscate_email(email)}\n👤 {telegram}"
-                    )
-
-            for user_id, email, telegram in trial_ending_users:
-                await bot.send_message(
-                    user_id,
-                    "⏳ Сизнинг синов муддатингиз бугун тугайди. Фойдаланишни давом эттириш учун тўлов қилинг.",
-                    reply_markup=get_payment_options(user_id)
-                )
-                for admin_id in ADMIN_IDS:
-                    await bot.send_message(
-                        admin_id,
-                        f"⏳ Синов муддати тугаяпти:\n"
-                        f"🆔 {user_id}\n📧 {obfuscate_email(email)}\n👤 {telegram}"
-                    )
+# Ежедневная проверка оплаты и пробного периода (задача планировщика).
+# Пропущенный за время простоя запуск выполняется после старта за текущий день;
+# повторная рассылка за тот же день отсекается по job_id.
+async def check_payments(scheduled_for):
+    today = scheduler.now().date()
+    # Выборка до деактивации: у неоплативших trial_end == payment_due, и после UPDATE
+    # (is_active = 0) пользователи с заканчивающимся сегодня пробным периодом уже не находятся
+    trial_ending_users = await db.get_users_near_trial_end(today)
+    expired_users = await db.expire_unpaid_users(today)
+
+    items = []
+    for user_id, email, telegram in expired_users:
+        items.append((
+            f"expired:{user_id}", user_id,
+            "❌ Сизнинг обунангиз муддати тугади. Яна фойдаланиш учун тўлов қилинг ва чекни юборинг.",
+            get_payment_options(user_id)
+        ))
+        admin_digest.add(
+            f"❌ Фойдаланувчи ўчирилди (обуна тугади):\n"
+            f"🆔 {user_id}\n📧 {obfuscate_email(email)}\n👤 {telegram}"
+        )
 
-        except Exception as e:
-            logger.error(f"Ошибка в check_payments: {e}")
-        await asyncio.sleep(24 * 60 * 60)  # Проверка раз в сутки
+    for user_id, email, telegram in trial_ending_users:
+        items.append((
+            f"trial:{user_id}", user_id,
+            "⏳ Сизнинг синов муддатингиз бугун тугайди. Фойдаланишни давом эттириш учун тўлов қилинг.",
+            get_payment_options(user_id)
+        ))
+        admin_digest.add(
+            f"⏳ Синов муддати тугаяпти:\n"
+            f"🆔 {user_id}\n📧 {obfuscate_email(email)}\n👤 {telegram}"
+        )
+
+    if items:
+        summary = await broadcaster.broadcast(f"check_payments:{today}", items)
+        admin_digest.add(
+            f"📬 Кунлик текширув якунланди ({today}):\n"
+            f"✅ Юборилди: {summary['sent']}\n"
+            f"🚫 Ботни блоклаган: {summary['blocked']}\n"
+            f"❌ Хатолик: {summary['failed']}\n"
+            f"⏱ {summary['duration']} сек."
+        )
+    await admin_digest.flush()
+
+# Напоминание за сутки до окончания пробного периода, в REMINDER_HOUR по времени SCHEDULER_TZ
+async def send_trial_reminders(scheduled_for):
+    if scheduled_for.hour < REMINDER_HOUR:
+        return
+    # День берётся от текущего времени, а не от scheduled_for: после простоя запоздалый запуск
+    # иначе выбрал бы истекающих сегодня, которых уже уведомляет check_payments
+    tomorrow = scheduler.now().date() + timedelta(days=1)
+    users = await db.claim_trial_reminders(tomorrow, tomorrow)
+    if not users:
+        return
+    items = [
+        (
+            f"trial_reminder:{user_id}", user_id,
+            f"⏳ Эслатма: синов муддатингиз {trial_end} куни тугайди. Фойдаланишни давом эттириш учун тўлов қилинг.",
+            get_payment_options(user_id)
+        )
+        for user_id, email, telegram, trial_end in users
+    ]
+    summary = await broadcaster.broadcast(f"trial_reminders:{scheduled_for:%Y-%m-%dT%H}", items)
+    logger.info(f"Напоминания о пробном периоде: отправлено {summary['sent']} из {summary['total']}")
+
+async def cleanup_processed_updates(scheduled_for):
+    await db.delete_old_processed_updates()
+
+async def cleanup_broadcasts(scheduled_for):
+    await db.delete_old_broadcast_messages(BROADCAST_RETENTION_DAYS)
+
+async def maintain_message_partitions(scheduled_for):
+    await message_archive.run(scheduled_for.date())
+
+async def deliver_vocabulary(scheduled_for):
+    remaining = (scheduled_for + timedelta(minutes=VOCABULARY_WINDOW) - scheduler.now()).total_seconds()
+    if remaining <= 0:
+        logger.warning(f"Рассылка слов за {scheduled_for:%Y-%m-%d} пропущена: окно доставки закончилось")
+        return
+    await vocabulary_delivery.run(scheduled_for.date(), time.monotonic() + remaining)
+
+# Слова за день, окно доставки которых закончилось, после смены лидера не досылаются
+def vocabulary_job_expired(job_id):
+    if not job_id.startswith(VOCABULARY_JOB_PREFIX):
+        return False
+    day = datetime.strptime(job_id[len(VOCABULARY_JOB_PREFIX):], "%Y-%m-%d").replace(tzinfo=scheduler.tz)
+    started = CronSchedule(VOCABULARY_CRON).next_after(day - timedelta(minutes=1))
+    return scheduler.now() >= started + timedelta(minutes=VOCABULARY_WINDOW)
+
+scheduler.add_job("check_payments", CHECK_PAYMENTS_CRON, check_payments)
+scheduler.add_job("trial_reminders", "5 * * * *", send_trial_reminders)
+scheduler.add_job("cleanup_processed_updates", "30 3 * * *", cleanup_processed_updates)
+scheduler.add_job("cleanup_broadcasts", "40 3 * * *", cleanup_broadcasts)
+scheduler.add_job("message_partitions", "45 3 * * *", maintain_message_partitions)
+scheduler.add_job("vocabulary", VOCABULARY_CRON, deliver_vocabulary)
 
 # Запуск бота с использованием webhook
 async def on_startup(_):
     logger.info("Запуск бота...")
-    await bot.delete_webhook(drop_pending_updates=True)
+    await db.connect()
+    if isinstance(storage, PostgresStorage):
+        storage.start()
+    admin_digest.start()
+    outbound.start()
+    await promo_index.start()
+    await message_log.start()
+    leader_lock.start(on_elected, on_demoted)
+
+async def on_elected():
     webhook_url = f"https://{os.getenv('RENDER_EXTERNAL_HOSTNAME')}/webhook"
-    await bot.set_webhook(url=webhook_url)
+    # Старые обновления сбрасываем только в однопроцессном режиме: при смене лидера
+    # остальные воркеры продолжают принимать их
+    await bot.set_webhook(url=webhook_url, drop_pending_updates=not MULTI_WORKER)
     logger.info(f"Webhook установлен: {webhook_url}")
-    asyncio.create_task(check_payments())
+    leader_tasks.append(asyncio.create_task(broadcaster.resume_pending(expired=vocabulary_job_expired)))
+    await scheduler.start()
+
+async def stop_leader_tasks():
+    await scheduler.stop()
+    for task in leader_tasks:
+        task.cancel()
+    leader_tasks.clear()
+
+async def on_demoted():
+    logger.warning("Процесс больше не лидер, фоновые задачи остановлены")
+    await stop_leader_tasks()
+
+async def on_shutdown(_):
+    await stop_leader_tasks()
+    await leader_lock.stop()
+    await admin_digest.stop()
+    await outbound.stop()
+    await promo_index.stop()
+    await message_log.stop()
+    await storage.close()
+    await db.close()
+    await bot.close()
+
+# Проверки для платформы: /healthz — процесс жив, /readyz — готов принимать обновления
+async def home(request):
+    return web.Response(text="Я жив! 👋")
+
+async def healthz(request):
+    return web.Response(text="ok")
+
+async def readyz(request):
+    checks = {"database": await db.ping()}
+    try:
+        session = await bot.get_session()
+        await asyncio.wait_for(bot.me, timeout=5)
+        checks["bot"] = not session.closed
+    except Exception as e:
+        logger.error(f"Проверка готовности бота не прошла: {e}")
+        checks["bot"] = False
+    return web.json_response(checks, status=200 if all(checks.values()) else 503)
 
-if __name__ == "__main__":
-    keep_alive()
+# Метрики процесса в текстовом формате Prometheus
+async def metrics_view(request):
+    return web.Response(text=await REGISTRY.render(), content_type="text/plain")
+
+def run_worker():
+    setup_logging()
     app = web.Application()
-    webhook_requests_handler = SimpleRequestHandler(
-        dispatcher=dp,
-        bot=bot,
-        secret_token="",  # Если используешь секретный токен, укажи его
-    )
-    webhook_requests_handler.register(app, path="/webhook")
-    setup_application(app, dp, bot=bot)
-    web.run_app(app, host="0.0.0.0", port=int(os.getenv("PORT", 8080)))
+    configure_app(dp, app, path="/webhook")
+    app.router.add_get("/", home)
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/readyz", readyz)
+    app.router.add_get("/metrics", metrics_view)
+    if fake_telegram is not None:
+        fake_telegram.add_routes(app, "/fake-telegram")
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
+    web.run_app(app, host="0.0.0.0", port=int(os.getenv("PORT", 8080)), reuse_port=MULTI_WORKER)
+    # Процесс-воркер завершается без atexit — дописываем очередь логов явно
+    stop_logging()
+
+# Несколько процессов на одном порту; упавший воркер перезапускается
+def run_workers():
+    workers = []
+
+    def start_worker(i):
+        worker = multiprocessing.Process(target=run_worker, name=f"worker-{i}")
+        worker.start()
+        return worker
+
+    def terminate(signum, frame):
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, terminate)
+    workers.extend(start_worker(i) for i in range(WEB_CONCURRENCY))
+    logger.info(f"Запущено воркеров: {WEB_CONCURRENCY}")
+    while True:
+        time.sleep(5)
+        for i, worker in enumerate(workers):
+            if not worker.is_alive():
+                logger.warning(f"Воркер {worker.name} завершился (код {worker.exitcode}), перезапуск")
+                workers[i] = start_worker(i)
+
+if __name__ == "__main__":
+    if MULTI_WORKER:
+        run_workers()
+    else:
+        run_worker()
@@ -0,0 +1,66 @@
+# media.py
+import asyncio
+import hashlib
+import io
+import logging
+import os
+
+from aiogram.types import InputFile
+from aiogram.utils.exceptions import WrongFileIdentifier, WrongRemoteFileIdSpecified
+
+logger = logging.getLogger(__name__)
+
+
+# Реестр статических файлов (логотип и т.п.): файл загружается в Telegram один раз,
+# полученный file_id хранится в media_assets и переиспользуется при следующих отправках.
+# Если файл на диске изменился (другая контрольная сумма) или Telegram отверг
+# file_id, файл загружается заново.
+class MediaRegistry:
+    def __init__(self, bot, db):
+        self.bot = bot
+        self.db = db
+        self._assets = {}
+        self._locks = {}
+
+    async def send_photo(self, chat_id, path, **kwargs):
+        name = os.path.basename(path)
+        file_id = await self._get_file_id(name, path)
+        if file_id:
+            try:
+                return await self.bot.send_photo(chat_id, file_id, **kwargs)
+            # Остальные BadRequest (чат не найден, неверная подпись) к file_id не относятся
+            except (WrongFileIdentifier, WrongRemoteFileIdSpecified) as e:
+                logger.warning(f"file_id для {name} недействителен, загружаем заново: {e}")
+                self._assets.pop(name, None)
+        return await self._upload(chat_id, name, path, **kwargs)
+
+    async def _get_file_id(self, name, path):
+        cached = self._assets.get(name)
+        if cached is None:
+            checksum = await asyncio.get_running_loop().run_in_executor(None, _checksum, path)
+            row = await self.db.get_media_asset(name)
+            if row is None or row[0] != checksum:
+                return None
+            cached = self._assets[name] = (checksum, row[1])
+        return cached[1]
+
+    async def _upload(self, chat_id, name, path, **kwargs):
+        # Одновременные /start не должны загружать один и тот же файл несколько раз
+        lock = self._locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            if name in self._assets:
+                return await self.bot.send_photo(chat_id, self._assets[name][1], **kwargs)
+            with open(path, "rb") as f:
+                data = f.read()
+            message = await self.bot.send_photo(chat_id, InputFile(io.BytesIO(data), filename=name), **kwargs)
+            checksum = hashlib.sha256(data).hexdigest()
+            file_id = message.photo[-1].file_id
+            self._assets[name] = (checksum, file_id)
+            await self.db.save_media_asset(name, checksum, file_id)
+            logger.info(f"Файл {name} загружен в Telegram, file_id сохранён")
+            return message
+
+
+def _checksum(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
@@ -0,0 +1,177 @@
+# message_log.py
+import asyncio
+import glob
+import gzip
+import json
+import logging
+import os
+import re
+from datetime import date, datetime
+
+from database import message_partition
+
+logger = logging.getLogger(__name__)
+
+_PARTITION_RE = re.compile(r"^messages_y\d{4}m\d{2}$")
+
+
+# Отложенная запись переписки с админом в таблицу messages.
+# Сообщения копятся в памяти и сохраняются одним COPY, когда набралось flush_size строк
+# или прошло flush_interval секунд. Если база недоступна, пакет дописывается в файл
+# в spool_dir и досылается после следующей успешной записи (или при старте).
+class MessageLog:
+    def __init__(self, db, flush_size=200, flush_interval=2.0, spool_dir="message_spool"):
+        self.db = db
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.spool_dir = spool_dir
+        self._rows = []
+        self._task = None
+        self._flush_lock = asyncio.Lock()
+
+    def add(self, user_id, message_text, is_from_user=True):
+        self._rows.append((user_id, message_text, 1 if is_from_user else 0, datetime.now()))
+        if len(self._rows) >= self.flush_size:
+            asyncio.create_task(self.flush())
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        await self.replay_spool()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении сообщений: {e}")
+
+    async def flush(self):
+        async with self._flush_lock:
+            rows, self._rows = self._rows, []
+            if not rows:
+                return
+            try:
+                await self.db.add_messages(rows)
+            except Exception as e:
+                logger.error(f"База недоступна, {len(rows)} сообщений записаны в spool: {e}")
+                await asyncio.get_running_loop().run_in_executor(None, self._write_spool, rows)
+                return
+            await self._replay_spool()
+
+    def _spool_path(self):
+        return os.path.join(self.spool_dir, f"messages-{os.getpid()}.jsonl")
+
+    def _write_spool(self, rows):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        with open(self._spool_path(), "a", encoding="utf-8") as f:
+            for user_id, message_text, is_from_user, timestamp in rows:
+                f.write(json.dumps([user_id, message_text, is_from_user, timestamp.isoformat()], ensure_ascii=False) + "\n")
+
+    # Файл сначала переименовывается: другой воркер не возьмёт его повторно
+    def _claim_spool_files(self):
+        claimed = []
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, "messages-*.jsonl"))):
+            replaying = f"{path}.{os.getpid()}.replay"
+            try:
+                os.rename(path, replaying)
+            except OSError:
+                continue
+            claimed.append((path, replaying))
+        return claimed
+
+    @staticmethod
+    def _read_spool(path):
+        rows = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    user_id, message_text, is_from_user, timestamp = json.loads(line)
+                    rows.append((user_id, message_text, is_from_user, datetime.fromisoformat(timestamp)))
+        return rows
+
+    async def replay_spool(self):
+        async with self._flush_lock:
+            await self._replay_spool()
+
+    async def _replay_spool(self):
+        if not os.path.isdir(self.spool_dir):
+            return
+        loop = asyncio.get_running_loop()
+        claimed = await loop.run_in_executor(None, self._claim_spool_files)
+        for i, (path, replaying) in enumerate(claimed):
+            rows = await loop.run_in_executor(None, self._read_spool, replaying)
+            try:
+                if rows:
+                    await self.db.add_messages(rows)
+            except Exception as e:
+                logger.error(f"Не удалось дослать сообщения из {path}: {e}")
+                # Возвращаем файлы на место — дошлём при следующей успешной записи
+                for path, replaying in claimed[i:]:
+                    os.replace(replaying, path)
+                return
+            os.remove(replaying)
+            logger.info(f"Досланы сообщения из spool: {len(rows)}")
+
+
+def _add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+# Обслуживание месячных разделов messages (задача планировщика): создаёт разделы
+# на months_ahead месяцев вперёд и выгружает разделы старше retention_months
+# в archive_dir/<раздел>.csv.gz, после чего удаляет их из базы.
+# retention_months=0 или archive_dir=None — переписка хранится без ограничения срока.
+class MessageArchive:
+    def __init__(self, db, archive_dir=None, retention_months=0, months_ahead=2):
+        self.db = db
+        self.archive_dir = archive_dir
+        self.retention_months = retention_months
+        self.months_ahead = months_ahead
+
+    async def run(self, today):
+        for offset in range(self.months_ahead + 1):
+            await self.db.create_message_partition(_add_months(today, offset))
+        if not self.retention_months:
+            return []
+        if not self.archive_dir:
+            logger.warning("Каталог архива переписки не задан, старые разделы messages не удаляются")
+            return []
+        oldest_kept, _, _ = message_partition(_add_months(today, -self.retention_months))
+        archived = []
+        for name in await self.db.get_message_partitions():
+            # Имена фиксированной ширины, поэтому сравнение строк совпадает с порядком месяцев
+            if _PARTITION_RE.match(name) and name < oldest_kept and await self.archive(name):
+                archived.append(name)
+        return archived
+
+    # Файл пишется рядом с расширением .part и переименовывается только целиком,
+    # раздел удаляется после этого
+    async def archive(self, name):
+        loop = asyncio.get_running_loop()
+        path = os.path.join(self.archive_dir, f"{name}.csv.gz")
+        partial = f"{path}.part"
+        await loop.run_in_executor(None, lambda: os.makedirs(self.archive_dir, exist_ok=True))
+        f = await loop.run_in_executor(None, gzip.open, partial, "wb")
+
+        async def write(chunk):
+            await loop.run_in_executor(None, f.write, chunk)
+
+        try:
+            exported = await self.db.export_message_partition(name, write)
+        finally:
+            await loop.run_in_executor(None, f.close)
+        await loop.run_in_executor(None, os.replace, partial, path)
+        if not await self.db.drop_message_partition(name, exported):
+            logger.warning(f"Раздел {name} изменился во время выгрузки, архивирование отложено")
+            return False
+        logger.info(f"Раздел {name} выгружен в {path} ({exported} сообщений) и удалён")
+        return True
@@ -0,0 +1,216 @@
+# metrics.py
+import asyncio
+import functools
+import inspect
+import logging
+import random
+import time
+
+from aiogram import Bot
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiogram.utils.exceptions import TelegramAPIError
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержки, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def inc(self, *label_values, amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        for label_values, value in sorted(self.values.items()):
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *label_values, value):
+        self.values[label_values] = value
+
+    def clear(self):
+        self.values.clear()
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}
+
+    def observe(self, *label_values, value):
+        # [счётчики по корзинам..., сумма, количество]
+        series = self.values.setdefault(label_values, [0] * len(self.buckets) + [0.0, 0])
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def samples(self):
+        for label_values, series in sorted(self.values.items()):
+            *counts, total, count = series
+            for bound, bucket_count in zip(self.buckets, counts):
+                yield f"{self.name}_bucket", _format_labels(self.labels + ("le",), label_values + (bound,)), bucket_count
+            yield f"{self.name}_bucket", _format_labels(self.labels + ("le",), label_values + ("+Inf",)), count
+            yield f"{self.name}_sum", _format_labels(self.labels, label_values), round(total, 6)
+            yield f"{self.name}_count", _format_labels(self.labels, label_values), count
+
+
+# Реестр метрик в текстовом формате Prometheus.
+# Коллекторы — корутины, которые обновляют gauge-метрики непосредственно перед отдачей /metrics.
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    async def render(self):
+        for collector in self.collectors:
+            try:
+                await collector()
+            except Exception as e:
+                logger.error(f"Ошибка при сборе метрик: {e}")
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HANDLER_LATENCY = REGISTRY.register(Histogram(
+    "wordzen_handler_duration_seconds", "Время работы обработчика обновления", ["update_type", "handler"]))
+DB_LATENCY = REGISTRY.register(Histogram(
+    "wordzen_db_call_duration_seconds", "Время выполнения метода Database", ["method"]))
+TELEGRAM_LATENCY = REGISTRY.register(Histogram(
+    "wordzen_telegram_request_duration_seconds", "Время запроса к Telegram Bot API", ["method"]))
+TELEGRAM_ERRORS = REGISTRY.register(Counter(
+    "wordzen_telegram_errors_total", "Ошибки запросов к Telegram Bot API", ["method", "error"]))
+FSM_STATES = REGISTRY.register(Gauge(
+    "wordzen_fsm_states", "Число активных состояний FSM", ["state"]))
+OUTBOUND_DEPTH = REGISTRY.register(Gauge(
+    "wordzen_outbound_queue_depth", "Сообщения в очереди исходящих"))
+THROTTLED_UPDATES = REGISTRY.register(Counter(
+    "wordzen_throttled_updates_total", "Обновления, отброшенные ограничением частоты пользователя", ["update_type"]))
+SHED_UPDATES = REGISTRY.register(Counter(
+    "wordzen_shed_updates_total", "Обновления, отброшенные при превышении лимита одновременной обработки", ["update_type"]))
+UPDATES_IN_FLIGHT = REGISTRY.register(Gauge(
+    "wordzen_updates_in_flight", "Обновления в обработке"))
+
+
+# Замеряет время обработчиков сообщений и callback-запросов.
+# Выборка sample_rate обновлений дополнительно пишется в лог со структурными полями.
+class HandlerMetricsMiddleware(BaseMiddleware):
+    def __init__(self, sample_rate=0.01):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    async def on_process_message(self, message, data):
+        self._start(data)
+
+    async def on_process_callback_query(self, callback_query, data):
+        self._start(data)
+
+    async def on_post_process_message(self, message, results, data):
+        self._finish("message", message.from_user.id, data)
+
+    async def on_post_process_callback_query(self, callback_query, results, data):
+        self._finish("callback_query", callback_query.from_user.id, data)
+
+    # handler_name задаёт фильтр CallbackRouter: иначе все кнопки считались бы одним обработчиком
+    @staticmethod
+    def _start(data):
+        handler = current_handler.get()
+        data["_metrics_handler"] = data.get("handler_name") or getattr(handler, "__name__", "unknown")
+        data["_metrics_started"] = time.monotonic()
+
+    def _finish(self, update_type, user_id, data):
+        started = data.get("_metrics_started")
+        if started is None:
+            return
+        elapsed = time.monotonic() - started
+        handler = data["_metrics_handler"]
+        HANDLER_LATENCY.observe(update_type, handler, value=elapsed)
+        if random.random() < self.sample_rate:
+            logger.info(
+                "Обработано обновление %s: %s за %.1f мс", update_type, handler, elapsed * 1000,
+                extra={"update_type": update_type, "handler": handler, "user_id": user_id, "duration_ms": round(elapsed * 1000, 1)}
+            )
+
+
+# Bot, который замеряет каждый запрос к Bot API и считает ошибки по типам
+class InstrumentedBot(Bot):
+    async def request(self, method, data=None, files=None, **kwargs):
+        started = time.monotonic()
+        try:
+            return await super().request(method, data, files, **kwargs)
+        except TelegramAPIError as e:
+            TELEGRAM_ERRORS.inc(method, type(e).__name__)
+            raise
+        except asyncio.TimeoutError:
+            TELEGRAM_ERRORS.inc(method, "TimeoutError")
+            raise
+        finally:
+            TELEGRAM_LATENCY.observe(method, value=time.monotonic() - started)
+
+
+# Оборачивает публичные корутины Database замером времени (метрика DB_LATENCY)
+def instrument_database(db, exclude=("connect", "close", "ping")):
+    for name, func in inspect.getmembers(type(db), inspect.iscoroutinefunction):
+        if name.startswith("_") or name in exclude:
+            continue
+        setattr(db, name, _timed(getattr(db, name), name))
+
+
+def _timed(method, name):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        started = time.monotonic()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            DB_LATENCY.observe(name, value=time.monotonic() - started)
+    return wrapper
+
+
+# Число пользователей в каждом состоянии FSM (только для хранилища с count_states)
+def fsm_states_collector(storage):
+    async def collect():
+        counts = await storage.count_states()
+        FSM_STATES.clear()
+        for state, count in counts.items():
+            FSM_STATES.set(state, value=count)
+    return collect
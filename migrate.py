@@ -0,0 +1,118 @@
+# migrate.py
+import asyncio
+import importlib.util
+import logging
+import os
+import re
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+NO_TRANSACTION_MARK = "-- migrate: no-transaction"
+# Ключ advisory-lock, чтобы миграции не применялись одновременно несколькими процессами
+LOCK_KEY = 7_301_001
+
+_FILENAME_RE = re.compile(r"^(\d+)_([\w-]+)\.(sql|py)$")
+
+
+# Миграции — файлы вида 0001_name.sql или 0002_name.py (с async def upgrade(conn))
+def discover(directory=MIGRATIONS_DIR):
+    migrations = []
+    for filename in os.listdir(directory):
+        match = _FILENAME_RE.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+    migrations.sort()
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError(f"Повторяющиеся номера миграций в {directory}")
+    return migrations
+
+
+async def _current_version(conn):
+    try:
+        return await conn.fetchval("SELECT MAX(version) FROM schema_version") or 0
+    except asyncpg.UndefinedTableError:
+        return 0
+
+
+async def _record(conn, version, name):
+    await conn.execute("INSERT INTO schema_version (version, name) VALUES ($1, $2)", version, name)
+
+
+async def _apply_sql(conn, version, name, path):
+    with open(path, encoding="utf-8") as f:
+        sql = f.read()
+    if sql.lstrip().startswith(NO_TRANSACTION_MARK):
+        # CREATE INDEX CONCURRENTLY и т.п. нельзя выполнять пакетом — по одной команде
+        body = "\n".join(line for line in sql.splitlines() if not line.strip().startswith("--"))
+        for statement in body.split(";"):
+            if statement.strip():
+                await conn.execute(statement)
+        await _record(conn, version, name)
+        return
+    async with conn.transaction():
+        await conn.execute(sql)
+        await _record(conn, version, name)
+
+
+async def _apply_py(conn, version, name, path):
+    spec = importlib.util.spec_from_file_location(f"migration_{version:04d}_{name}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    if not getattr(module, "TRANSACTIONAL", True):
+        await module.upgrade(conn)
+        await _record(conn, version, name)
+        return
+    async with conn.transaction():
+        await module.upgrade(conn)
+        await _record(conn, version, name)
+
+
+# Применяет все миграции новее текущей версии. Если схема актуальна —
+# выполняется один SELECT и никакого DDL.
+async def run_migrations(pool, directory=MIGRATIONS_DIR):
+    migrations = discover(directory)
+    latest = migrations[-1][0] if migrations else 0
+    async with pool.acquire() as conn:
+        if await _current_version(conn) >= latest:
+            return
+        # Ждём блокировку опросом, а не pg_advisory_lock: висящий запрос другого процесса
+        # не даст завершиться CREATE INDEX CONCURRENTLY и приведёт к deadlock
+        while not await conn.fetchval("SELECT pg_try_advisory_lock($1)", LOCK_KEY):
+            await asyncio.sleep(0.5)
+        try:
+            await conn.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )''')
+            current = await _current_version(conn)
+            if current >= latest:
+                return
+            for version, name, path in migrations:
+                if version <= current:
+                    continue
+                logger.info(f"Применение миграции {version:04d}_{name}")
+                if path.endswith(".py"):
+                    await _apply_py(conn, version, name, path)
+                else:
+                    await _apply_sql(conn, version, name, path)
+            logger.info(f"Схема базы данных обновлена до версии {latest}")
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", LOCK_KEY)
+
+
+async def _main():
+    pool = await asyncpg.create_pool(os.getenv("DATABASE_URL"), min_size=1, max_size=1)
+    try:
+        await run_migrations(pool)
+    finally:
+        await pool.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    asyncio.run(_main())
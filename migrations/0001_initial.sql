@@ -0,0 +1,45 @@
+-- Базовая схема. IF NOT EXISTS — чтобы миграция безопасно применялась к уже существующей базе.
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    user_id BIGINT UNIQUE,
+    source TEXT,
+    email TEXT UNIQUE,
+    telegram TEXT,
+    books TEXT,
+    trial_end TEXT,
+    payment_due TEXT,
+    paid_months INTEGER DEFAULT 0,
+    payment_confirmed INTEGER DEFAULT 0,
+    promo_code TEXT
+);
+ALTER TABLE users ADD COLUMN IF NOT EXISTS is_active INTEGER DEFAULT 1;
+
+CREATE TABLE IF NOT EXISTS promo_codes (
+    code TEXT PRIMARY KEY,
+    teacher_name TEXT,
+    used_count INTEGER DEFAULT 0,
+    bonus_days INTEGER DEFAULT 7
+);
+
+CREATE TABLE IF NOT EXISTS messages (
+    id SERIAL PRIMARY KEY,
+    user_id BIGINT,
+    message_text TEXT,
+    is_from_user INTEGER DEFAULT 1,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Прогресс рассылок (broadcast.py)
+CREATE TABLE IF NOT EXISTS broadcast_messages (
+    job_id TEXT,
+    item_key TEXT,
+    chat_id BIGINT,
+    message_text TEXT,
+    reply_markup TEXT,
+    status TEXT DEFAULT 'pending',
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (job_id, item_key)
+);
+CREATE INDEX IF NOT EXISTS broadcast_messages_pending_idx ON broadcast_messages (job_id) WHERE status = 'pending';
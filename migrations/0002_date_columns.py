@@ -0,0 +1,48 @@
+# Перевод trial_end/payment_due из TEXT в DATE без долгой блокировки users:
+# данные копируются в теневые столбцы пачками, а строки, которые меняются во время
+# копирования, заполняет триггер. Под блокировкой остаются только удаление триггера
+# и переименование столбцов.
+TRANSACTIONAL = False
+BATCH_SIZE = 5000
+
+# Некорректные старые значения становятся NULL
+TEXT_TO_DATE = "CASE WHEN {column} ~ '^\\d{{4}}-\\d{{2}}-\\d{{2}}$' THEN {column}::date END"
+
+
+async def upgrade(conn):
+    text_columns = await conn.fetchval(
+        "SELECT COUNT(*) FROM information_schema.columns WHERE table_name = 'users' AND column_name IN ('trial_end', 'payment_due') AND data_type = 'text'"
+    )
+    if not text_columns:
+        return
+    trial_end = TEXT_TO_DATE.format(column="trial_end")
+    payment_due = TEXT_TO_DATE.format(column="payment_due")
+
+    await conn.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS trial_end_date DATE, ADD COLUMN IF NOT EXISTS payment_due_date DATE")
+    # Триггер создаётся до чтения MAX(id): CREATE TRIGGER дожидается незавершённых вставок,
+    # поэтому всё, что не попадёт в пачки, пройдёт через триггер
+    await conn.execute(f'''CREATE OR REPLACE FUNCTION users_sync_date_columns() RETURNS trigger AS $$
+        BEGIN
+            NEW.trial_end_date := {TEXT_TO_DATE.format(column="NEW.trial_end")};
+            NEW.payment_due_date := {TEXT_TO_DATE.format(column="NEW.payment_due")};
+            RETURN NEW;
+        END $$ LANGUAGE plpgsql''')
+    await conn.execute("DROP TRIGGER IF EXISTS users_sync_date_columns ON users")
+    await conn.execute(
+        "CREATE TRIGGER users_sync_date_columns BEFORE INSERT OR UPDATE OF trial_end, payment_due ON users "
+        "FOR EACH ROW EXECUTE FUNCTION users_sync_date_columns()"
+    )
+    max_id = await conn.fetchval("SELECT COALESCE(MAX(id), 0) FROM users")
+    for start in range(0, max_id, BATCH_SIZE):
+        await conn.execute(
+            f"UPDATE users SET trial_end_date = {trial_end}, payment_due_date = {payment_due} WHERE id > $1 AND id <= $2",
+            start, start + BATCH_SIZE
+        )
+    async with conn.transaction():
+        await conn.execute("SET LOCAL lock_timeout = '5s'")
+        await conn.execute("LOCK TABLE users IN ACCESS EXCLUSIVE MODE")
+        await conn.execute("DROP TRIGGER users_sync_date_columns ON users")
+        await conn.execute("DROP FUNCTION users_sync_date_columns()")
+        await conn.execute("ALTER TABLE users DROP COLUMN trial_end, DROP COLUMN payment_due")
+        await conn.execute("ALTER TABLE users RENAME COLUMN trial_end_date TO trial_end")
+        await conn.execute("ALTER TABLE users RENAME COLUMN payment_due_date TO payment_due")
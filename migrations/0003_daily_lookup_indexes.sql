@@ -0,0 +1,6 @@
+-- migrate: no-transaction
+-- Индексы под ежедневные выборки и историю сообщений.
+-- CONCURRENTLY не блокирует запись, но не может выполняться внутри транзакции.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_payment_due_unpaid_idx ON users (payment_due) WHERE payment_confirmed = 0 AND is_active = 1;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_trial_end_unpaid_idx ON users (trial_end) WHERE payment_confirmed = 0 AND is_active = 1;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS messages_user_id_timestamp_idx ON messages (user_id, timestamp);
@@ -0,0 +1,7 @@
+INSERT INTO promo_codes (code, teacher_name, used_count, bonus_days) VALUES
+    ('Teacher01', 'Teacher01', 0, 7), ('Teacher02', 'Teacher02', 0, 7), ('Teacher03', 'Teacher03', 0, 7),
+    ('Teacher04', 'Teacher04', 0, 7), ('Teacher05', 'Teacher05', 0, 7), ('Teacher06', 'Teacher06', 0, 7),
+    ('Teacher07', 'Teacher07', 0, 7), ('Teacher08', 'Teacher08', 0, 7), ('Teacher09', 'Teacher09', 0, 7),
+    ('Teacher10', 'Teacher10', 0, 7), ('Teacher11', 'Teacher11', 0, 7), ('Teacher12', 'Teacher12', 0, 7),
+    ('Teacher13', 'Teacher13', 0, 7), ('Teacher14', 'Teacher14', 0, 7), ('Teacher15', 'Teacher15', 0, 7)
+ON CONFLICT (code) DO NOTHING;
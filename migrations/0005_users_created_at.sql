@@ -0,0 +1,5 @@
+-- migrate: no-transaction
+-- Дата регистрации для фильтра /users по периоду. У старых записей остаётся NULL.
+ALTER TABLE users ADD COLUMN IF NOT EXISTS created_at TIMESTAMP;
+ALTER TABLE users ALTER COLUMN created_at SET DEFAULT CURRENT_TIMESTAMP;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_created_at_idx ON users (created_at);
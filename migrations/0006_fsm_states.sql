@@ -0,0 +1,11 @@
+-- Состояния FSM (fsm_storage.PostgresStorage)
+CREATE TABLE IF NOT EXISTS fsm_states (
+    chat TEXT,
+    "user" TEXT,
+    state TEXT,
+    data JSONB DEFAULT '{}',
+    bucket JSONB DEFAULT '{}',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (chat, "user")
+);
+CREATE INDEX IF NOT EXISTS fsm_states_updated_at_idx ON fsm_states (updated_at);
@@ -0,0 +1,6 @@
+-- Обработанные update_id для защиты от повторной доставки webhook
+CREATE TABLE IF NOT EXISTS processed_updates (
+    update_id BIGINT PRIMARY KEY,
+    processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS processed_updates_processed_at_idx ON processed_updates (processed_at);
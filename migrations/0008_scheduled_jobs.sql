@@ -0,0 +1,10 @@
+-- Состояние задач планировщика (scheduler.py)
+CREATE TABLE IF NOT EXISTS scheduled_jobs (
+    name TEXT PRIMARY KEY,
+    schedule TEXT,
+    next_run TIMESTAMPTZ,
+    last_run TIMESTAMPTZ,
+    last_finished TIMESTAMPTZ,
+    last_status TEXT,
+    last_error TEXT
+);
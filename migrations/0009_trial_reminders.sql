@@ -0,0 +1,5 @@
+-- migrate: no-transaction
+-- Отметка о напоминании за сутки до конца пробного периода и индекс под выборку
+-- ещё не напомненных пользователей по trial_end
+ALTER TABLE users ADD COLUMN IF NOT EXISTS trial_reminder_sent_at TIMESTAMP;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_trial_reminder_due_idx ON users (trial_end) WHERE trial_reminder_sent_at IS NULL AND payment_confirmed = 0 AND is_active = 1;
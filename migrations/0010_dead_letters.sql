@@ -0,0 +1,11 @@
+-- Сообщения, которые очередь исходящих (outbound.py) не смогла доставить
+CREATE TABLE IF NOT EXISTS dead_letters (
+    id BIGSERIAL PRIMARY KEY,
+    chat_id BIGINT NOT NULL,
+    method TEXT NOT NULL,
+    payload JSONB,
+    error TEXT,
+    attempts INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS dead_letters_chat_id_idx ON dead_letters (chat_id);
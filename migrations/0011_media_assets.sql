@@ -0,0 +1,7 @@
+-- file_id загруженных в Telegram статических файлов (media.py)
+CREATE TABLE IF NOT EXISTS media_assets (
+    name TEXT PRIMARY KEY,
+    checksum TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
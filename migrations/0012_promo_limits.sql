@@ -0,0 +1,16 @@
+-- Лимит использований и срок действия промокодов; коды уникальны без учёта регистра
+ALTER TABLE promo_codes ADD COLUMN IF NOT EXISTS max_uses INTEGER;
+ALTER TABLE promo_codes ADD COLUMN IF NOT EXISTS expires_at DATE;
+CREATE UNIQUE INDEX IF NOT EXISTS promo_codes_upper_code_idx ON promo_codes (upper(code));
+
+-- Уведомление для индекса промокодов в памяти (promo.py) при любом изменении таблицы
+CREATE OR REPLACE FUNCTION notify_promo_codes_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('promo_codes_changed', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS promo_codes_changed ON promo_codes;
+CREATE TRIGGER promo_codes_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON promo_codes
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_promo_codes_changed();
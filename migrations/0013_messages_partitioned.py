@@ -0,0 +1,48 @@
+# Перевод messages на месячные разделы по timestamp (messages_yГГГГmММ).
+# Старые разделы архивирует и удаляет MessageArchive (message_log.py), новые
+# создаются заранее той же задачей. Первичный ключ секционированной таблицы
+# обязан включать ключ секционирования, поэтому он становится (timestamp, id);
+# id по-прежнему берётся из messages_id_seq.
+from datetime import date
+
+MONTHS_AHEAD = 2
+
+
+def _month(d, offset=0):
+    index = d.year * 12 + d.month - 1 + offset
+    return date(index // 12, index % 12 + 1, 1)
+
+
+async def upgrade(conn):
+    partitioned = await conn.fetchval("SELECT relkind = 'p' FROM pg_class WHERE oid = 'messages'::regclass")
+    if partitioned:
+        return
+    # Переписка с админом невелика, поэтому таблица копируется целиком под блокировкой
+    await conn.execute("SET LOCAL lock_timeout = '5s'")
+    await conn.execute("LOCK TABLE messages IN ACCESS EXCLUSIVE MODE")
+    await conn.execute('''CREATE TABLE messages_partitioned (
+        id BIGINT NOT NULL DEFAULT nextval('messages_id_seq'),
+        user_id BIGINT,
+        message_text TEXT,
+        is_from_user INTEGER DEFAULT 1,
+        timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (timestamp, id)
+    ) PARTITION BY RANGE (timestamp)''')
+
+    first = await conn.fetchval("SELECT MIN(timestamp) FROM messages") or date.today()
+    month, last = _month(first), _month(date.today(), MONTHS_AHEAD)
+    while month <= last:
+        await conn.execute(
+            f"CREATE TABLE messages_y{month:%Y}m{month:%m} PARTITION OF messages_partitioned "
+            f"FOR VALUES FROM ('{month}') TO ('{_month(month, 1)}')"
+        )
+        month = _month(month, 1)
+
+    await conn.execute('''INSERT INTO messages_partitioned (id, user_id, message_text, is_from_user, timestamp)
+        SELECT id, user_id, message_text, is_from_user, COALESCE(timestamp, CURRENT_TIMESTAMP) FROM messages''')
+    await conn.execute("ALTER SEQUENCE messages_id_seq OWNED BY messages_partitioned.id")
+    await conn.execute("DROP TABLE messages")
+    await conn.execute("ALTER TABLE messages_partitioned RENAME TO messages")
+    await conn.execute("ALTER TABLE messages RENAME CONSTRAINT messages_partitioned_pkey TO messages_pkey")
+    # Под постраничный /history: WHERE user_id = $1 AND (timestamp, id) < (...) ORDER BY timestamp DESC, id DESC
+    await conn.execute("CREATE INDEX messages_user_id_timestamp_idx ON messages (user_id, timestamp, id)")
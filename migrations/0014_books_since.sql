@@ -0,0 +1,3 @@
+-- День, с которого пользователь читает текущие книги: от него считается порция слов
+-- ежедневной рассылки (vocabulary.py). Для старых записей используется created_at.
+ALTER TABLE users ADD COLUMN IF NOT EXISTS books_since DATE;
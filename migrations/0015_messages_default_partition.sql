@@ -0,0 +1,4 @@
+-- Раздел по умолчанию для messages: строки за месяц, раздел которого ещё не создан
+-- (задача message_partitions не запускалась) или уже выгружен в архив (досылка из spool),
+-- не должны ломать запись. create_message_partition переносит такие строки в новый раздел.
+CREATE TABLE IF NOT EXISTS messages_default PARTITION OF messages DEFAULT;
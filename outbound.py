@@ -0,0 +1,118 @@
+# outbound.py
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import deque
+
+from aiogram.utils.exceptions import ChatNotFound, NetworkError, RetryAfter, TelegramAPIError, Unauthorized
+
+from broadcast import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+# Очередь исходящих сообщений: обработчик кладёт вызов bot.send_* в очередь и сразу
+# возвращается, доставкой занимаются воркеры. Чат закреплён за одним воркером
+# (chat_id % workers), поэтому сообщения одному пользователю приходят по порядку.
+# RetryAfter и сетевые ошибки повторяются с экспоненциальной задержкой, сообщения,
+# которые доставить нельзя (бот заблокирован, чат не найден, исчерпаны попытки),
+# сохраняются в таблицу dead_letters.
+class OutboundQueue:
+    def __init__(self, bot, db, workers=4, maxsize=1000, rate=25, max_retries=5, base_delay=1.0, max_delay=60):
+        self.bot = bot
+        self.db = db
+        self.workers = workers
+        self.limiter = RateLimiter(rate)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._queues = [asyncio.Queue(maxsize=max(1, maxsize // workers)) for _ in range(workers)]
+        self._tasks = []
+        self._latencies = deque(maxlen=1000)
+        self.counters = {"enqueued": 0, "sent": 0, "retried": 0, "dead": 0}
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(queue)) for queue in self._queues]
+
+    # Ждёт доставки уже поставленных сообщений не дольше timeout секунд
+    async def stop(self, timeout=10):
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self._queues)), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Очередь исходящих не доставлена при остановке: {self.depth()} сообщений")
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    # method — имя метода бота (send_message, send_photo, send_document, ...).
+    # Если очередь переполнена, ждём свободного места (backpressure), а не теряем сообщение.
+    async def send(self, method, chat_id, *args, **kwargs):
+        queue = self._queues[int(chat_id) % self.workers]
+        await queue.put((method, chat_id, args, kwargs, time.monotonic()))
+        self.counters["enqueued"] += 1
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self.send("send_message", chat_id, text, **kwargs)
+
+    def depth(self):
+        return sum(queue.qsize() for queue in self._queues)
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+        return {
+            "depth": self.depth(),
+            **self.counters,
+            "latency_avg": sum(latencies) / len(latencies) if latencies else 0.0,
+            "latency_p95": latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+        }
+
+    async def _worker(self, queue):
+        while True:
+            item = await queue.get()
+            try:
+                await self._deliver(*item)
+            except Exception as e:
+                logger.error(f"Ошибка в очереди исходящих: {e}")
+            finally:
+                queue.task_done()
+
+    def _backoff(self, attempt):
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def _deliver(self, method, chat_id, args, kwargs, enqueued_at):
+        error = None
+        for attempt in range(self.max_retries):
+            await self.limiter.acquire()
+            try:
+                await getattr(self.bot, method)(chat_id, *args, **kwargs)
+                self.counters["sent"] += 1
+                self._latencies.append(time.monotonic() - enqueued_at)
+                return
+            except RetryAfter as e:
+                logger.warning(f"Flood control при отправке {method} в {chat_id}, пауза {e.timeout} сек.")
+                self.limiter.pause(e.timeout)
+                error = str(e)
+            except (Unauthorized, ChatNotFound) as e:
+                error = str(e)
+                break
+            except NetworkError as e:
+                error = str(e)
+                await asyncio.sleep(self._backoff(attempt))
+            except TelegramAPIError as e:
+                error = str(e)
+                break
+            self.counters["retried"] += 1
+        self.counters["dead"] += 1
+        logger.warning(f"Сообщение {method} для {chat_id} не доставлено: {error}")
+        payload = json.dumps({"args": args, "kwargs": kwargs}, ensure_ascii=False, default=_to_python)
+        await self.db.add_dead_letter(chat_id, method, payload, error, attempt + 1)
+
+
+def _to_python(obj):
+    if hasattr(obj, "to_python"):
+        return obj.to_python()
+    return str(obj)
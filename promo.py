@@ -0,0 +1,91 @@
+# promo.py
+import asyncio
+import logging
+from datetime import date
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "promo_codes_changed"
+
+
+# Индекс промокодов в памяти: проверка введённого кода не обращается к базе.
+# Поиск без учёта регистра; индекс перечитывается по уведомлению promo_codes_changed
+# (триггер на таблице) и раз в refresh_interval секунд на случай потери соединения.
+# Проверка здесь предварительная — лимит и срок окончательно проверяет Database.add_user.
+class PromoIndex:
+    def __init__(self, db, dsn, refresh_interval=300):
+        self.db = db
+        self.dsn = dsn
+        self.refresh_interval = refresh_interval
+        self._codes = {}
+        self._conn = None
+        self._task = None
+        self._changed = asyncio.Event()
+
+    async def start(self):
+        try:
+            await self._listen()
+            self._changed.clear()
+        except Exception as e:
+            logger.error(f"Не удалось подписаться на изменения промокодов: {e}")
+        await self.reload()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+    async def reload(self):
+        rows = await self.db.get_promo_codes()
+        if rows is None:
+            return
+        self._codes = {
+            code.upper(): {"code": code, "bonus_days": bonus_days, "used_count": used_count, "max_uses": max_uses, "expires_at": expires_at}
+            for code, bonus_days, used_count, max_uses, expires_at in rows
+        }
+        logger.debug("Индекс промокодов обновлён: %s кодов", len(self._codes))
+
+    # Действующий промокод (словарь с каноническим написанием code) или None
+    def lookup(self, code):
+        promo = self._codes.get(code.strip().upper())
+        if promo is None:
+            return None
+        if promo["expires_at"] is not None and promo["expires_at"] < date.today():
+            return None
+        if promo["max_uses"] is not None and promo["used_count"] >= promo["max_uses"]:
+            return None
+        return promo
+
+    def _on_notify(self, connection, pid, channel, payload):
+        self._changed.set()
+
+    async def _listen(self):
+        if self._conn is None or self._conn.is_closed():
+            self._conn = await asyncpg.connect(self.dsn)
+            await self._conn.add_listener(CHANNEL, self._on_notify)
+            # Изменения, пропущенные пока слушателя не было
+            self._changed.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await self._listen()
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout=self.refresh_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._changed.clear()
+                await self.reload()
+            except Exception as e:
+                logger.error(f"Ошибка при обновлении индекса промокодов: {e}")
+                if self._conn is not None:
+                    self._conn.terminate()
+                    self._conn = None
+                await asyncio.sleep(self.refresh_interval / 10)
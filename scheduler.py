@@ -0,0 +1,140 @@
+# scheduler.py
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+
+# Расписание в формате cron: "минута час день месяц день_недели" (0 = воскресенье).
+# Поддерживаются *, числа, диапазоны a-b, списки через запятую и шаг */n, a-b/n.
+class CronSchedule:
+    RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Ожидается 5 полей cron: {expression!r}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            self._parse(field, low, high) for field, (low, high) in zip(fields, self.RANGES)
+        )
+        if 7 in self.weekdays:
+            self.weekdays = (self.weekdays - {7}) | {0}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse(field, low, high):
+        values = set()
+        for part in field.split(","):
+            part, _, step = part.partition("/")
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start, end = map(int, part.split("-"))
+            else:
+                start = end = int(part)
+            if start < low or end > high or start > end:
+                raise ValueError(f"Значение вне диапазона {low}-{high}: {field!r}")
+            if step and part != "*" and "-" not in part:
+                end = high
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def _day_matches(self, dt):
+        day_ok = dt.day in self.days
+        weekday_ok = (dt.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    # Ближайший момент строго после dt (в часовом поясе dt)
+    def next_after(self, dt):
+        tz = dt.tzinfo
+        local = (dt.replace(tzinfo=None) + timedelta(minutes=1)).replace(second=0, microsecond=0)
+        limit = local + timedelta(days=5 * 366)
+        while local < limit:
+            if local.month not in self.months:
+                local = (local.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(local):
+                local = local.replace(hour=0, minute=0) + timedelta(days=1)
+            elif local.hour not in self.hours:
+                local = local.replace(minute=0) + timedelta(hours=1)
+            elif local.minute not in self.minutes:
+                local += timedelta(minutes=1)
+            else:
+                return local.replace(tzinfo=tz)
+        raise ValueError(f"Расписание никогда не срабатывает: {self.expression!r}")
+
+
+# Планировщик задач с состоянием в таблице scheduled_jobs.
+# next_run хранится в базе, поэтому перезапуск не сдвигает расписание, а пропущенный
+# за время простоя запуск выполняется один раз сразу после старта (catch-up).
+# Запуск «захватывается» условным UPDATE, так что задачу не выполнят два процесса.
+class Scheduler:
+    def __init__(self, db, timezone="Asia/Tashkent", tick=30):
+        self.db = db
+        self.tz = ZoneInfo(timezone)
+        self.tick = tick
+        self.jobs = {}
+        self._running = {}
+        self._task = None
+
+    # func — корутина, принимает время запланированного запуска
+    def add_job(self, name, cron, func):
+        self.jobs[name] = (CronSchedule(cron), func)
+
+    def now(self):
+        return datetime.now(self.tz)
+
+    async def start(self):
+        now = self.now()
+        await self.db.register_scheduled_jobs([
+            (name, schedule.expression, schedule.next_after(now)) for name, (schedule, _) in self.jobs.items()
+        ])
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in self._running.values():
+            task.cancel()
+        self._running.clear()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_due()
+            except Exception as e:
+                logger.error(f"Ошибка планировщика: {e}")
+            await asyncio.sleep(self.tick)
+
+    async def run_due(self):
+        now = self.now()
+        for name, next_run in await self.db.get_due_jobs(list(self.jobs), now):
+            if name in self._running:
+                continue
+            schedule, func = self.jobs[name]
+            if await self.db.claim_scheduled_job(name, next_run, schedule.next_after(now)):
+                scheduled_for = next_run.astimezone(self.tz)
+                if scheduled_for < now - timedelta(minutes=5):
+                    logger.info(f"Пропущенный запуск задачи {name} за {scheduled_for}, выполняем сейчас")
+                self._running[name] = asyncio.create_task(self._execute(name, func, scheduled_for))
+
+    async def _execute(self, name, func, scheduled_for):
+        error = None
+        try:
+            logger.info(f"Запуск задачи {name}")
+            await func(scheduled_for)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка в задаче {name}: {e}")
+            error = str(e)
+        finally:
+            self._running.pop(name, None)
+        await self.db.finish_scheduled_job(name, error)
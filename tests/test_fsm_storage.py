@@ -0,0 +1,90 @@
+# tests/test_fsm_storage.py
+# Запуск: python -m unittest discover tests
+import asyncio
+import json
+import os
+import sys
+import unittest
+from contextlib import asynccontextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fsm_storage import PostgresStorage
+
+
+# Таблица fsm_states в памяти; запись пакета ждёт commit_gate, чтобы flush() можно было
+# «заморозить» посреди транзакции
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+
+    async def fetchrow(self, query, chat, user, state_ttl):
+        return self.db.rows.get((chat, user))
+
+    async def executemany(self, query, args):
+        await self.db.commit_gate.wait()
+        for chat, user, state, data, bucket in args:
+            self.db.rows[(chat, user)] = {"state": state, "data": data, "bucket": bucket}
+
+    async def execute(self, query, chats, users):
+        await self.db.commit_gate.wait()
+        for key in zip(chats, users):
+            self.db.rows.pop(key, None)
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.rows = {}
+        self.commit_gate = asyncio.Event()
+        self.commit_gate.set()
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield FakeConnection(self)
+
+    transaction = acquire
+
+
+class PostgresStorageFlushTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.db = FakeDatabase()
+        # cache_ttl=0, как при нескольких воркерах: кэш процесса не спасает от устаревшего чтения
+        self.storage = PostgresStorage(self.db, cache_ttl=0)
+
+    async def test_update_data_then_set_state_during_flush(self):
+        await self.storage.set_state(chat=1, user=1, state="Registration:source")
+        await self.storage.flush()
+
+        await self.storage.update_data(chat=1, user=1, source="instagram")
+        # Сброс после обработки другого пользователя забирает изменения и ждёт commit
+        self.db.commit_gate.clear()
+        flush = asyncio.create_task(self.storage.flush())
+        await asyncio.sleep(0)
+        self.assertFalse(self.storage._dirty)
+
+        await self.storage.set_state(chat=1, user=1, state="Registration:promo")
+        self.db.commit_gate.set()
+        await flush
+        await self.storage.flush()
+
+        self.assertEqual(await self.storage.get_state(chat=1, user=1), "Registration:promo")
+        self.assertEqual(await self.storage.get_data(chat=1, user=1), {"source": "instagram"})
+        row = self.db.rows[("1", "1")]
+        self.assertEqual(row["state"], "Registration:promo")
+        self.assertEqual(json.loads(row["data"]), {"source": "instagram"})
+
+    async def test_failed_flush_keeps_changes(self):
+        await self.storage.update_data(chat=1, user=1, email="a@example.com")
+        self.db.transaction = self._failing_transaction
+        with self.assertRaises(ConnectionError):
+            await self.storage.flush()
+        self.assertEqual(await self.storage.get_data(chat=1, user=1), {"email": "a@example.com"})
+
+    @asynccontextmanager
+    async def _failing_transaction(self):
+        raise ConnectionError("connection lost")
+        yield
+
+
+if __name__ == "__main__":
+    unittest.main()
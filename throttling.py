@@ -0,0 +1,108 @@
+# throttling.py
+import asyncio
+import logging
+import time
+
+from aiogram import types
+from aiogram.dispatcher.handler import CancelHandler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from metrics import SHED_UPDATES, THROTTLED_UPDATES
+
+logger = logging.getLogger(__name__)
+
+
+# Token bucket на каждого пользователя: burst обновлений подряд, дальше rate в секунду.
+# Корзины, которые успели заполниться целиком, периодически удаляются — для них
+# новая корзина ничем не отличается от старой.
+class TokenBuckets:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.refill_time = burst / rate
+        self._buckets = {}
+        self._next_sweep = 0.0
+
+    def take(self, key, now):
+        if now >= self._next_sweep:
+            self._sweep(now)
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            return False
+        self._buckets[key] = (tokens - 1, now)
+        return True
+
+    def _sweep(self, now):
+        self._buckets = {
+            key: (tokens, updated) for key, (tokens, updated) in self._buckets.items()
+            if now - updated < self.refill_time
+        }
+        self._next_sweep = now + self.refill_time
+
+
+# Защита от всплесков нагрузки для сообщений и нажатий на кнопки:
+# — пользователь, превысивший свою частоту (TokenBuckets), получает короткое «подождите»;
+# — если одновременно обрабатывается max_in_flight обновлений, новые не ждут очереди,
+#   а сразу получают «попробуйте позже» (load shedding).
+# Отказ не обращается к базе; текстовый ответ пользователю отправляется не чаще раза
+# в notice_interval секунд, на callback_query отвечаем всегда (иначе у кнопки крутится индикатор).
+# Админы (exempt) не ограничиваются. Должен подключаться после UpdateDeduplicationMiddleware:
+# слот освобождается в on_post_process_update, который не вызывается, если обновление
+# отменил следующий middleware.
+class ThrottlingMiddleware(BaseMiddleware):
+    def __init__(self, rate=1.0, burst=10, max_in_flight=100, exempt=(), notice_interval=10,
+                 throttled_text="⏳ Жуда тез. Бироз кутиб, қайта уриниб кўринг.",
+                 overloaded_text="⏳ Ҳозир юклама юқори. Бироздан сўнг қайта уриниб кўринг."):
+        super().__init__()
+        self.buckets = TokenBuckets(rate, burst) if rate else None
+        self.max_in_flight = max_in_flight
+        self.exempt = set(exempt)
+        self.notice_interval = notice_interval
+        self.throttled_text = throttled_text
+        self.overloaded_text = overloaded_text
+        self.in_flight = 0
+        self._semaphore = asyncio.Semaphore(max_in_flight) if max_in_flight else None
+        self._notified = {}
+
+    async def on_pre_process_update(self, update, data):
+        event = update.message or update.callback_query
+        if event is None or event.from_user is None or event.from_user.id in self.exempt:
+            return
+        user_id = event.from_user.id
+        update_type = "callback_query" if update.callback_query else "message"
+        now = time.monotonic()
+        if self.buckets is not None and not self.buckets.take(user_id, now):
+            THROTTLED_UPDATES.inc(update_type)
+            logger.debug("Обновление пользователя %s отброшено: превышена частота", user_id)
+            await self._reject(event, user_id, now, self.throttled_text)
+            raise CancelHandler()
+        if self._semaphore is not None:
+            if self._semaphore.locked():
+                SHED_UPDATES.inc(update_type)
+                logger.debug("Обновление пользователя %s отброшено: в обработке %s обновлений", user_id, self.in_flight)
+                await self._reject(event, user_id, now, self.overloaded_text)
+                raise CancelHandler()
+            await self._semaphore.acquire()
+            self.in_flight += 1
+            data["_throttling_slot"] = True
+
+    async def on_post_process_update(self, update, results, data):
+        if data.pop("_throttling_slot", False):
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    async def _reject(self, event, user_id, now, text):
+        try:
+            if isinstance(event, types.CallbackQuery):
+                await event.answer(text)
+                return
+            if self._notified.get(user_id, 0) > now:
+                return
+            if len(self._notified) > 10000:
+                self._notified = {key: until for key, until in self._notified.items() if until > now}
+            self._notified[user_id] = now + self.notice_interval
+            await event.answer(text)
+        except Exception as e:
+            logger.error(f"Ошибка при ответе на отброшенное обновление {user_id}: {e}")
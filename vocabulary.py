@@ -0,0 +1,132 @@
+# vocabulary.py
+import asyncio
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# job_id рассылки слов: vocabulary:ГГГГ-ММ-ДД
+JOB_PREFIX = "vocabulary:"
+
+
+# Имя файла словаря книги: "Essential 1 (rus)" -> "essential-1-rus"
+def book_slug(title):
+    return re.sub(r"[^a-z0-9]+", "-", title.lower()).strip("-")
+
+
+# Словари книг в памяти. Файл directory/<slug>.tsv, по строке на слово:
+# "слово<TAB>перевод[<TAB>пример]", строки с # и пустые пропускаются.
+# Слова хранятся уже отформатированными строками (tuple на книгу), поэтому порция
+# пользователя собирается срезами без разбора файлов и без обращения к базе.
+class VocabularyIndex:
+    def __init__(self, books, directory="vocabulary", words_per_book=5):
+        self.books = list(books)
+        self.directory = directory
+        self.words_per_book = words_per_book
+        self._words = {}
+        # users.books — строка "Книга 1, Книга 2, Книга 3"; у многих пользователей она совпадает
+        self._selections = {}
+
+    async def reload(self):
+        words = await asyncio.get_running_loop().run_in_executor(None, self._load)
+        self._words = words
+        self._selections = {}
+        logger.info(f"Словари загружены: {len(words)} книг, {sum(map(len, words.values()))} слов")
+
+    def _load(self):
+        words = {}
+        for title in self.books:
+            path = os.path.join(self.directory, f"{book_slug(title)}.tsv")
+            if not os.path.exists(path):
+                logger.warning(f"Нет словаря для книги {title}: {path}")
+                continue
+            lines = []
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line or line.startswith("#"):
+                        continue
+                    word, _, rest = line.partition("\t")
+                    translation, _, example = rest.partition("\t")
+                    entry = f"• {word} — {translation}" if translation else f"• {word}"
+                    lines.append(f"{entry}\n  {example}" if example else entry)
+            if lines:
+                words[title] = tuple(lines)
+        return words
+
+    def selection(self, books):
+        selected = self._selections.get(books)
+        if selected is None:
+            selected = tuple(title for title in (books or "").split(", ") if title in self._words)
+            self._selections[books] = selected
+        return selected
+
+    # Порция на day-й день чтения: по words_per_book слов из каждой книги, по кругу
+    def batch(self, books, day):
+        result = []
+        for title in self.selection(books):
+            words = self._words[title]
+            start = day * self.words_per_book % len(words)
+            chunk = words[start:start + self.words_per_book]
+            if len(chunk) < self.words_per_book:
+                chunk += words[:self.words_per_book - len(chunk)]
+            result.append((title, chunk))
+        return result
+
+    def __len__(self):
+        return len(self._words)
+
+
+# Ежедневная рассылка слов: получатели читаются из users страницами по page_size,
+# каждая страница отправляется через Broadcaster (ограничение частоты, повторы, прогресс
+# в broadcast_messages). item_key — user_id, поэтому повторный запуск за тот же день
+# не отправит слова второй раз. Страницы, до которых не дошли к deadline
+# (time.monotonic()), не отправляются — вчерашние слова на следующий день не нужны.
+class VocabularyDelivery:
+    def __init__(self, db, broadcaster, index, page_size=1000):
+        self.db = db
+        self.broadcaster = broadcaster
+        self.index = index
+        self.page_size = page_size
+
+    def format_message(self, books, books_since, today):
+        batch = self.index.batch(books, (today - books_since).days)
+        if not batch:
+            return None
+        text = f"📖 Бугунги сўзлар ({today:%d.%m.%Y}):"
+        for title, words in batch:
+            text += f"\n\n📘 {title}\n" + "\n".join(words)
+        return text[:4096]
+
+    async def run(self, today, deadline):
+        await self.index.reload()
+        summary = {"users": 0, "sent": 0, "blocked": 0, "failed": 0, "skipped": 0}
+        if not len(self.index):
+            logger.warning("Словари не загружены, рассылка слов пропущена")
+            return summary
+        job_id = f"{JOB_PREFIX}{today}"
+        after_id = 0
+        while True:
+            rows = await self.db.get_vocabulary_recipients(after_id, self.page_size)
+            if not rows:
+                break
+            after_id = rows[-1]["id"]
+            if time.monotonic() >= deadline:
+                summary["skipped"] += len(rows)
+                continue
+            items = []
+            for row in rows:
+                text = self.format_message(row["books"], row["books_since"], today)
+                if text is not None:
+                    items.append((f"vocabulary:{row['user_id']}", row["user_id"], text, None))
+            summary["users"] += len(items)
+            if items:
+                page = await self.broadcaster.broadcast(job_id, items)
+                for key in ("sent", "blocked", "failed"):
+                    summary[key] += page[key]
+        if summary["skipped"]:
+            logger.error(f"Рассылка слов за {today} не уложилась в окно: не отправлено {summary['skipped']} пользователям")
+        logger.info(f"Рассылка слов за {today}: {summary}")
+        return summary